@@ -15,17 +15,24 @@ app.use("/images", express.static(path.join(__dirname, "images")));
 const offersRoute = require("./routes/offers");
 app.use("/api/search", offersRoute);
 
-function startScraperOnBoot() {
-  const process = spawn("python", ["../Flyer_reader/csv_to_sql.py"], {
+const scraperRoute = require("./routes/scraper");
+app.use("/api/scraper", scraperRoute);
+
+const basketRoute = require("./routes/basket");
+app.use("/api/basket", basketRoute);
+
+// The worker stays up and re-checks the shops on its own schedule, see Flyer_reader/scraper_worker.py
+function startScraperWorker() {
+  const process = spawn("python", ["../Flyer_reader/scraper_worker.py"], {
     stdio: "inherit", // shows logs in backend console
   });
 
   process.on("close", (code) => {
-    console.log("Scraper finished with code:", code);
+    console.log("Scraper worker stopped with code:", code);
   });
 
   process.on("error", (err) => {
-    console.error("Failed to start scraper:", err);
+    console.error("Failed to start scraper worker:", err);
   });
 }
 
@@ -35,6 +42,6 @@ app.get("/", (req, res) => res.send("Backend running"));
 
 app.listen(PORT, () => {
   console.log(`Server running at http://localhost:${PORT}`);
-  startScraperOnBoot();
+  startScraperWorker();
 });
 
@@ -0,0 +1,20 @@
+// routes/basket.js
+const express = require("express");
+const router = express.Router();
+const { forward } = require("../worker");
+
+/**
+ * POST /api/basket
+ * Body: { items: ["pienas", "duona", ...], max_shops: 2 }
+ * Cheapest single shop basket and cheapest split over at most max_shops shops for a grocery list,
+ * worked out by the scraper worker (Flyer_reader/basket.py). Totals and prices are in cents.
+ */
+router.post("/", (req, res) =>
+  forward(res, "/basket", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(req.body ?? {}),
+  })
+);
+
+module.exports = router;
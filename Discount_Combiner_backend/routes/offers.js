@@ -8,6 +8,34 @@ function normalize(str = "") {
   return unidecode(String(str).toLowerCase());
 }
 
+// Same units and Lithuanian endings as Flyer_reader/search_tokens.py, which stems the titles at ingest
+const UNITS = new Set(["kg", "mg", "g", "ml", "cl", "l", "vnt", "kl", "pak", "cm", "m", "x", "eur"]);
+const QUANTITY = /^[0-9]+(?:[.,][0-9]+)?(?:x[0-9]+)?(?:kg|mg|g|ml|cl|l|vnt|kl|pak|cm|m)?$/;
+const STEM_ENDINGS = ["iais", "iems", "ioms", "ams", "oms", "ems", "ims", "ums", "ais", "iai", "iu", "ies",
+  "as", "is", "ys", "us", "os", "es", "ai", "ei", "ui", "a", "e", "i", "o", "u", "y"];
+const MIN_STEM = 3;
+
+function stem(word) {
+  const ending = STEM_ENDINGS.find(e => word.endsWith(e) && word.length - e.length >= MIN_STEM);
+  return ending ? word.slice(0, -ending.length) : word;
+}
+
+// Stemmed words of a normalised query, matched against the titles' stored search tokens
+function searchTokens(q) {
+  const words = q.match(/[a-z0-9]+(?:[.,][0-9]+)?/g) || [];
+  return words.filter(w => !UNITS.has(w) && !QUANTITY.test(w)).map(stem).join(" ");
+}
+
+// Offer columns every query returns, quantity / unit / unit_price / discount_percent are parsed at ingest
+const COLUMNS = `id, title, shop, price, old_price, date_start, date_end, img, additional_info, discount,
+  quantity, unit, unit_price, discount_percent`;
+const UNIT_FILTERS = new Set(["kg", "l", "vnt"]);
+// ORDER BY of each sort option, served by the (unit, unit_price) and discount_percent indexes
+const SORTS = {
+  unit_price: "unit_price ASC NULLS LAST",
+  discount: "discount_percent DESC NULLS LAST",
+};
+
 function parseFilters(filters) {
   if (!filters) return null;
   if (Array.isArray(filters)) return filters.map(f => f.toLowerCase());
@@ -19,6 +47,8 @@ function parseFilters(filters) {
  * Query params:
  *   q: search query
  *   filters: comma-separated shops (optional)
+ *   unit: kg | l | vnt, only offers whose price per unit is known in that unit (optional)
+ *   sort: unit_price | discount (optional, search results default to relevance, lists to id)
  *   limit: number (default 40)
  *   offset: number (default 0)
  */
@@ -30,33 +60,59 @@ router.get("/", async (req, res) => {
     const filters = parseFilters(req.query.filters);
     const limit = Math.min(parseInt(req.query.limit || "40", 10), 200);
     const offset = parseInt(req.query.offset || "0", 10);
+    const unit = UNIT_FILTERS.has(req.query.unit) ? req.query.unit : null;
+    const sort = SORTS[req.query.sort] ? `${SORTS[req.query.sort]}, ` : "";
+
+    // Shop and unit conditions, numbered after the params a query already uses
+    function conditions(params) {
+      const where = [];
+      if (filters) {
+        params.push(filters);
+        where.push(`shop = ANY($${params.length})`);
+      }
+      if (unit) {
+        params.push(unit);
+        where.push(`unit = $${params.length} AND unit_price IS NOT NULL`);
+      }
+      return where;
+    }
+
+    function page(params) {
+      params.push(limit, offset);
+      return `LIMIT $${params.length - 1} OFFSET $${params.length}`;
+    }
 
     // If no search query -> simple filtered list (paged)
     if (!qTrim) {
+      const params = [];
+      const where = conditions(params);
       const sql = `
-        SELECT id, title, shop, price, old_price, date_start, date_end, img, additional_info, discount
+        SELECT ${COLUMNS}
         FROM main_offers
-        ${filters ? "WHERE shop = ANY($1)" : ""}
-        ORDER BY id ASC
-        LIMIT $${filters ? 2 : 1} OFFSET $${filters ? 3 : 2};
+        ${where.length ? `WHERE ${where.join(" AND ")}` : ""}
+        ORDER BY ${sort}id ASC
+        ${page(params)};
       `;
-      const params = filters ? [filters, limit, offset] : [limit, offset];
       const r = await pool.query(sql, params);
       return res.json(r.rows);
     }
 
-    // If searching: 1) try full-text search with ranking
-    // Use deterministic ordering: rank DESC then id ASC so paging is stable
+    // If searching: 1) try full-text search with ranking on the stored, GIN indexed search_vector.
+    // The query matches either as typed or by its stems (e.g. "morka" finds "morkos").
+    // Use deterministic ordering: (sort,) rank DESC then id ASC so paging is stable
+    const fullTextParams = [q, searchTokens(q)];
+    const fullTextWhere = ["search_vector @@ query.tsq", ...conditions(fullTextParams)];
     const fullTextSql = `
-      SELECT id, title, shop, price, old_price, date_start, date_end, img, additional_info, discount,
-        ts_rank_cd(to_tsvector('simple', title_normalized), plainto_tsquery('simple', $1)) AS rank
-      FROM main_offers
-      WHERE to_tsvector('simple', title_normalized) @@ plainto_tsquery('simple', $1)
-      ${filters ? "AND shop = ANY($2)" : ""}
-      ORDER BY rank DESC, id ASC
-      LIMIT $${filters ? 3 : 2} OFFSET $${filters ? 4 : 3};
+      WITH query AS (
+        SELECT plainto_tsquery('simple', $1) || plainto_tsquery('simple', $2) AS tsq
+      )
+      SELECT ${COLUMNS},
+        ts_rank_cd(search_vector, query.tsq) AS rank
+      FROM main_offers, query
+      WHERE ${fullTextWhere.join(" AND ")}
+      ORDER BY ${sort}rank DESC, id ASC
+      ${page(fullTextParams)};
     `;
-    const fullTextParams = filters ? [q, filters, limit, offset] : [q, limit, offset];
 
     const fullTextResult = await pool.query(fullTextSql, fullTextParams);
 
@@ -65,17 +121,17 @@ router.get("/", async (req, res) => {
       return res.json(fullTextResult.rows);
     }
 
-    // 2) Fallback to ILIKE match (if no full-text matches)
-    // Use same deterministic ordering (id ASC)
+    // 2) Fallback to ILIKE match (if no full-text matches), served by the pg_trgm index on title_normalized
+    // Use same deterministic ordering ((sort,) id ASC)
+    const likeParams = [`%${q}%`];
+    const likeWhere = ["title_normalized ILIKE $1", ...conditions(likeParams)];
     const likeSql = `
-      SELECT id, title, shop, price, old_price, date_start, date_end, img, additional_info, discount
+      SELECT ${COLUMNS}
       FROM main_offers
-      WHERE title_normalized ILIKE $1
-      ${filters ? "AND shop = ANY($2)" : ""}
-      ORDER BY id ASC
-      LIMIT $${filters ? 3 : 2} OFFSET $${filters ? 4 : 3};
+      WHERE ${likeWhere.join(" AND ")}
+      ORDER BY ${sort}id ASC
+      ${page(likeParams)};
     `;
-    const likeParams = filters ? [`%${q}%`, filters, limit, offset] : [`%${q}%`, limit, offset];
 
     const likeResult = await pool.query(likeSql, likeParams);
     return res.json(likeResult.rows);
@@ -86,4 +142,86 @@ router.get("/", async (req, res) => {
   }
 });
 
+/**
+ * GET /api/search/groups
+ * Answers a grocery list: for each item the offers grouped into the same product as its best match
+ * (product_groups, filled by Flyer_reader/product_matching.py), followed by the item's other top ranked matches.
+ * Query params:
+ *   item: grocery list item, repeated once per item (?item=pienas&item=duona)
+ *   filters: comma-separated shops (optional)
+ *   limit: ranked matches per item besides the group (default 40)
+ * Returns [{ item, results }] in list order, results: the group cheapest per unit first, then the matches by rank.
+ */
+router.get("/groups", async (req, res) => {
+  try {
+    const items = [].concat(req.query.item ?? []).map(i => String(i).trim()).filter(Boolean).slice(0, 50);
+    const filters = parseFilters(req.query.filters);
+    const limit = Math.min(parseInt(req.query.limit || "40", 10), 200);
+    const shopFilter = filters ? "AND m.shop = ANY($4)" : "";
+
+    // Indexed lookups per item: the best ranked match (preferring grouped offers) picks the group, the top
+    // limit matches not in it follow
+    const sql = `
+      WITH query AS (
+        SELECT plainto_tsquery('simple', $1) || plainto_tsquery('simple', $2) AS tsq
+      ),
+      best AS (
+        SELECT g.group_id
+        FROM main_offers m
+        CROSS JOIN query
+        LEFT JOIN product_groups g ON g.offer_id = m.id
+        WHERE m.search_vector @@ query.tsq ${shopFilter}
+        ORDER BY (g.group_id IS NULL), ts_rank_cd(m.search_vector, query.tsq) DESC, m.id ASC
+        LIMIT 1
+      ),
+      matches AS (
+        SELECT m.id AS offer_id, 1 AS part, ts_rank_cd(m.search_vector, query.tsq) AS match_rank
+        FROM main_offers m
+        CROSS JOIN query
+        LEFT JOIN product_groups g ON g.offer_id = m.id
+        WHERE m.search_vector @@ query.tsq ${shopFilter}
+          AND (g.group_id IS NULL OR g.group_id <> (SELECT group_id FROM best))
+        ORDER BY match_rank DESC, m.id ASC
+        LIMIT $3
+      ),
+      picked AS (
+        SELECT offer_id, 0 AS part, NULL::real AS match_rank
+        FROM product_groups WHERE group_id = (SELECT group_id FROM best)
+        UNION ALL
+        SELECT offer_id, part, match_rank FROM matches
+      )
+      SELECT ${COLUMNS}, g.group_id
+      FROM picked
+      JOIN main_offers m ON m.id = picked.offer_id
+      LEFT JOIN product_groups g ON g.offer_id = m.id
+      WHERE TRUE ${shopFilter}
+      ORDER BY picked.part, picked.match_rank DESC NULLS FIRST, unit_price ASC NULLS LAST, price ASC NULLS LAST,
+        id ASC;
+    `;
+    // Items the full-text search finds nothing for are matched by title like GET /api/search does
+    const likeSql = `
+      SELECT ${COLUMNS}, g.group_id
+      FROM main_offers m
+      LEFT JOIN product_groups g ON g.offer_id = m.id
+      WHERE m.title_normalized ILIKE $1 ${filters ? "AND m.shop = ANY($3)" : ""}
+      ORDER BY id ASC
+      LIMIT $2;
+    `;
+
+    const groups = await Promise.all(items.map(async item => {
+      const q = normalize(item);
+      const params = [q, searchTokens(q), limit];
+      const r = await pool.query(sql, filters ? [...params, filters] : params);
+      if (r.rows.length > 0) return { item, results: r.rows };
+      const like = await pool.query(likeSql, filters ? [`%${q}%`, limit, filters] : [`%${q}%`, limit]);
+      return { item, results: like.rows };
+    }));
+    return res.json(groups);
+
+  } catch (err) {
+    console.error("Offer groups route error:", err);
+    res.status(500).json({ error: "Server error" });
+  }
+});
+
 module.exports = router;
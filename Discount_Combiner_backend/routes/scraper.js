@@ -0,0 +1,49 @@
+// routes/scraper.js
+const crypto = require("crypto");
+const express = require("express");
+const router = express.Router();
+const { forward } = require("../worker");
+
+const LOOPBACK = new Set(["127.0.0.1", "::1", "::ffff:127.0.0.1"]);
+
+function sameToken(given, token) {
+  const a = Buffer.from(given ?? "");
+  const b = Buffer.from(`Bearer ${token}`);
+  return a.length === b.length && crypto.timingSafeEqual(a, b);
+}
+
+// Runs scrape the shops' sites, so only callers with SCRAPER_API_TOKEN (as a Bearer token) may queue them,
+// or when no token is set, callers on this machine
+function allowRun(req, res, next) {
+  const token = process.env.SCRAPER_API_TOKEN;
+  const allowed = token
+    ? sameToken(req.get("Authorization"), token)
+    : LOOPBACK.has(req.socket.remoteAddress);
+  if (!allowed) {
+    return res.status(403).json({ error: "Not allowed to start scraper runs" });
+  }
+  next();
+}
+
+/**
+ * GET /api/scraper/status
+ * Current run, next check per shop and the last runs of the scraper worker.
+ */
+router.get("/status", (req, res) => forward(res, "/status"));
+
+/**
+ * POST /api/scraper/run
+ * Body (optional): { shops: ["rimi", ...], force: true }
+ * Header: Authorization: Bearer <SCRAPER_API_TOKEN>, only localhost callers are allowed without a token set
+ * Queues a scraper run, force re-scrapes even if the offers are still fresh. A run of the same shops
+ * that is already queued is answered instead of queueing another one.
+ */
+router.post("/run", allowRun, (req, res) =>
+  forward(res, "/run", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(req.body ?? {}),
+  })
+);
+
+module.exports = router;
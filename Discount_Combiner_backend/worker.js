@@ -0,0 +1,14 @@
+// Client of the scraper worker's localhost endpoint, see Flyer_reader/scraper_worker.py
+const WORKER_URL = `http://127.0.0.1:${process.env.SCRAPER_WORKER_PORT || 8765}`;
+
+async function forward(res, path, options = {}) {
+  try {
+    const r = await fetch(WORKER_URL + path, options);
+    res.status(r.status).json(await r.json());
+  } catch (err) {
+    console.error("Scraper worker unreachable:", err.message);
+    res.status(503).json({ error: "Scraper worker unavailable" });
+  }
+}
+
+module.exports = { forward };
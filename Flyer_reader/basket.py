@@ -0,0 +1,202 @@
+"""
+Cheapest way to buy a grocery list from the current offers: the cheapest single shop, and the cheapest
+split of the list over at most k shops (every item bought where it is cheapest among the chosen shops).
+
+Each item's candidates are the cheapest offer per shop whose title matches every word of the item
+(as typed or stemmed, like the backend's search), fetched for the whole list in one query.
+
+    python basket.py pienas duona "kiaušiniai" --max-shops 2
+"""
+import argparse
+import json
+import threading
+from collections import OrderedDict
+from csv_to_sql import connect, normalize_fast
+from search_tokens import search_tokens
+
+# Items whose candidates an index keeps, the least recently asked ones are dropped first
+INDEX_SIZE = 5000
+
+
+def fetch_candidates(items, cur):
+    """
+    Cheapest current offer of every shop for each item, in one query.
+
+    :param items: grocery list items as typed
+    :return: list (in items order) of dictionaries shop -> offer dictionary (id, title, price in cents, ...)
+    """
+    queries = [normalize_fast(item) for item in items]
+    cur.execute(
+        """
+        SELECT DISTINCT ON (i.n, m.shop) i.n, m.shop, m.id, m.title, m.price, m.unit_price, m.unit, m.img
+        FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS i(q, stems, n)
+        JOIN main_offers m
+          ON m.search_vector @@ (plainto_tsquery('simple', i.q) || plainto_tsquery('simple', i.stems))
+        WHERE m.price IS NOT NULL AND (m.date_end IS NULL OR m.date_end >= CURRENT_DATE)
+        ORDER BY i.n, m.shop, m.price, m.id;
+        """,
+        (queries, [search_tokens(q) for q in queries])
+    )
+    candidates = [{} for _ in items]
+    for n, shop, id, title, price, unit_price, unit, img in cur.fetchall():
+        candidates[n - 1][shop] = {
+            "id": id, "title": title, "shop": shop, "price": price, "unit_price": unit_price, "unit": unit, "img": img
+        }
+    return candidates
+
+
+class CandidateIndex:
+    """
+    Per item candidate cache in front of fetch_candidates: only items not seen since the last clear()
+    are queried. Clear it whenever main_offers changes.
+    """
+
+    def __init__(self, size=INDEX_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, items, cur):
+        keys = [normalize_fast(item) for item in items]
+        with self._lock:
+            missing = list(dict.fromkeys(k for k in keys if k not in self._items))
+        fetched = dict(zip(missing, fetch_candidates(missing, cur))) if missing else {}
+        with self._lock:
+            self._items.update(fetched)
+            result = []
+            for k in keys:
+                candidates = fetched.get(k) or self._items.get(k, {})
+                if k in self._items:
+                    self._items.move_to_end(k)
+                result.append(candidates)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def basket_cost(prices, shops):
+    """
+    :param prices: per item dictionaries shop -> price in cents
+    :return: (items not available in any of shops, total cents of the others bought where cheapest)
+    """
+    missing = 0
+    total = 0
+    for item_prices in prices:
+        available = [item_prices[shop] for shop in shops if shop in item_prices]
+        if available:
+            total += min(available)
+        else:
+            missing += 1
+    return missing, total
+
+
+def cheapest_split(prices, shops, max_shops):
+    """
+    Branch and bound over sets of at most max_shops shops. A set's cost is (items it misses, total cents),
+    compared as a tuple, so covering more of the list always wins over being cheaper.
+    Adding shops never raises the cost, so a branch is cut when even all its remaining shops together
+    can't beat the best set found.
+
+    :return: (cost, shops tuple)
+    """
+    # Shops that are cheap on their own first, so good sets are found early and prune the rest
+    shops = sorted(shops, key=lambda shop: basket_cost(prices, [shop]))
+    best = (basket_cost(prices, ()), ())
+
+    def search(chosen, start):
+        nonlocal best
+        cost = basket_cost(prices, chosen)
+        if cost < best[0]:
+            best = (cost, tuple(chosen))
+        if len(chosen) == max_shops or start == len(shops):
+            return
+        # Lower bound of every extension: the chosen shops plus all the remaining ones
+        if basket_cost(prices, chosen + shops[start:]) >= best[0]:
+            return
+        for i in range(start, len(shops)):
+            search(chosen + [shops[i]], i + 1)
+
+    search([], 0)
+    return best
+
+
+def plan_basket(items, candidates, max_shops=2):
+    """
+    :param items: grocery list items as typed
+    :param candidates: per item dictionaries shop -> offer, see fetch_candidates
+    :param max_shops: most shops the split may use
+    :return: {"single": basket or None, "split": basket or None}, a basket being
+             {"shops": [...], "total": cents, "missing": [items], "items": [{"item", "offer"}]}
+    """
+    prices = [{shop: offer["price"] for shop, offer in c.items()} for c in candidates]
+    shops = sorted({shop for c in candidates for shop in c})
+
+    def basket(cost, chosen):
+        if not chosen:
+            return None
+        lines = []
+        for item, item_candidates in zip(items, candidates):
+            offers = [item_candidates[shop] for shop in chosen if shop in item_candidates]
+            lines.append({"item": item, "offer": min(offers, key=lambda o: o["price"]) if offers else None})
+        return {
+            "shops": list(chosen),
+            "total": cost[1],
+            "missing": [line["item"] for line in lines if line["offer"] is None],
+            "items": lines,
+        }
+
+    single = min(((basket_cost(prices, [shop]), (shop,)) for shop in shops), default=(None, ()))
+    return {
+        "single": basket(*single),
+        "split": basket(*cheapest_split(prices, shops, max(1, max_shops))),
+    }
+
+
+def optimise_basket(items, cur, max_shops=2, index=None):
+    """
+    Cheapest single shop basket and cheapest split over at most max_shops shops for a grocery list.
+
+    :param cur: DB cursor
+    :param index: CandidateIndex to reuse candidates of earlier lists from, items are queried directly without one
+    :return: see plan_basket
+    """
+    items = [item.strip() for item in items if item and item.strip()]
+    candidates = index.get(items, cur) if index else fetch_candidates(items, cur)
+    return plan_basket(items, candidates, max_shops)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cheapest shops for a grocery list from the current offers.")
+    parser.add_argument("items", nargs="+", help="grocery list items")
+    parser.add_argument("--max-shops", type=int, default=2, help="most shops the split may use (default 2)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        result = optimise_basket(args.items, conn.cursor(), args.max_shops)
+    finally:
+        conn.close()
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, default=str))
+        return
+    for name, basket in (("Single shop", result["single"]), (f"Up to {args.max_shops} shops", result["split"])):
+        if basket is None:
+            print(f"{name}: no offers found")
+            continue
+        print(f"{name}: {', '.join(basket['shops'])} - {basket['total'] / 100:.2f} €")
+        for line in basket["items"]:
+            offer = line["offer"]
+            if offer:
+                print(f"    {line['item']}: {offer['title']} ({offer['shop']}) {offer['price'] / 100:.2f} €")
+            else:
+                print(f"    {line['item']}: not found")
+
+
+if __name__ == "__main__":
+    main()
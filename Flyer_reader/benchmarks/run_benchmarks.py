@@ -0,0 +1,263 @@
+"""
+Offline benchmarks for the flyer readers and the offers loader.
+
+Card templates in fixtures/ are replicated into pages with --cards cards each and run through every
+reader's extraction code, in one process and (parallel.* stages) over --processes extraction processes,
+then the extracted offers go through csv_to_sql's normalisation and converter.
+converter runs against a stand-in cursor that consumes the COPY stream, or against a real PostgreSQL
+database when --dsn is given (use a throwaway database, main_offers is created and rewritten there).
+
+Each stage reports throughput (best of --repeat runs) and peak traced memory. Results are compared
+with baseline.json, stages slower than --tolerance are reported as regressions and make the exit code 1.
+
+    python benchmarks/run_benchmarks.py --cards 10000
+    python benchmarks/run_benchmarks.py --save-baseline
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import card_cache  # noqa: E402
+import csv_to_sql  # noqa: E402
+import extraction  # noqa: E402
+import html_parsing  # noqa: E402
+import offer  # noqa: E402
+import unit_price  # noqa: E402
+
+FIXTURES = BENCH_DIR / "fixtures"
+BASELINE = BENCH_DIR / "baseline.json"
+
+BENCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS main_offers (
+    id serial PRIMARY KEY,
+    shop text NOT NULL,
+    title text,
+    title_normalized text,
+    price integer,
+    old_price integer,
+    discount text,
+    date_start date,
+    date_end date,
+    additional_info text,
+    img text,
+    scraped_at timestamptz NOT NULL DEFAULT now(),
+    UNIQUE (shop, title_normalized, date_start)
+);
+"""
+
+
+def build_page(shop, cards):
+    """Returns the shop's fixture page with the card template repeated cards times (__N__ -> card number)."""
+    page = (FIXTURES / f"{shop}_page.html").read_text(encoding="utf-8")
+    card = (FIXTURES / f"{shop}_card.html").read_text(encoding="utf-8")
+    return page.replace("<!-- CARDS -->", "".join(card.replace("__N__", str(n)) for n in range(cards)))
+
+
+class StandInCursor:
+    """Cursor stand-in for converter: consumes COPY buffers and answers the few queries it reads back."""
+
+    def __init__(self):
+        self.rowcount = 0
+        self.copied = 0
+
+    def execute(self, sql, params=None):
+        self.rowcount = self.copied if sql.lstrip().startswith("INSERT INTO main_offers") else 0
+
+    def copy_expert(self, sql, buf):
+        self.copied += sum(1 for _ in buf)
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return (0,)
+
+
+class StandInConnection:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def measure(fn, repeat):
+    """Runs fn repeat times and once more under tracemalloc. Returns (best seconds, peak bytes, result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def run(cards, repeat, dsn=None, processes=1):
+    # Every registered reader with a fixture page, parsed without a card cache
+    readers = {shop: reader for shop, reader in csv_to_sql.SHOPS.items() if (FIXTURES / f"{shop}_page.html").exists()}
+    pages = {shop: build_page(shop, cards) for shop in readers}
+
+    results = {}
+    offers = {}
+
+    def record(stage, items, seconds, peak):
+        results[stage] = {
+            "items": items,
+            "seconds": round(seconds, 4),
+            "items_per_s": round(items / seconds, 1) if seconds else None,
+            "peak_mb": round(peak / 1024 / 1024, 2),
+        }
+
+    # Single process parse first, the baseline every other extraction is compared with
+    extraction.PROCESSES = 1
+    for shop, reader in readers.items():
+        seconds, peak, shop_offers = measure(lambda: reader.parse(pages[shop]), repeat)
+        if len(shop_offers) != cards:
+            raise Exception(f"{shop} fixture produced {len(shop_offers)} offers instead of {cards}")
+        offers[shop] = shop_offers
+        record(f"parse.{shop}", len(shop_offers), seconds, peak)
+
+    # Re-reading unchanged pages: every card is found in the previous run's card store
+    store = card_cache.CardStore(Path(tempfile.mkdtemp()) / "cards.sqlite3")
+    for shop, reader in readers.items():
+        warm = card_cache.CardCache(shop, store)
+        reader.parse(pages[shop], warm)
+        warm.save()
+        seconds, peak, _ = measure(lambda: reader.parse(pages[shop], card_cache.CardCache(shop, store)), repeat)
+        record(f"card_cache.{shop}", cards, seconds, peak)
+
+    # The same pages with their cards fanned out over the extraction processes
+    if processes > 1:
+        extraction.PROCESSES = processes
+        for shop, reader in readers.items():
+            reader.parse(pages[shop])  # starts the pool outside the timed runs
+            seconds, peak, shop_offers = measure(lambda: reader.parse(pages[shop]), repeat)
+            if shop_offers != offers[shop]:
+                raise Exception(f"{shop} offers extracted in {processes} processes differ from the single process ones")
+            record(f"parallel.{shop}", len(shop_offers), seconds, peak)
+        extraction.close_extractor()
+        extraction.PROCESSES = 1
+
+    all_offers = [o for shop_offers in offers.values() for o in shop_offers]
+    titles = [o.title or "" for o in all_offers]
+    # The scraped text the offers' typed prices and dates were parsed from
+    prices = [f"{o.price // 100}.{o.price % 100:02d}" for o in all_offers if o.price]
+    dates = [f"{o.date_end.month}.{o.date_end.day:02d}" for o in all_offers if o.date_end]
+    normalized = [csv_to_sql.normalize_fast(t) for t in titles]
+
+    for stage, fn, items in (
+        ("normalize", lambda: [csv_to_sql.normalize(t) for t in titles], titles),
+        ("normalize_fast", lambda: [csv_to_sql.normalize_fast(t) for t in titles], titles),
+        ("price_to_cents", lambda: [offer.price_to_cents(p) for p in prices], prices),
+        ("convert_date", lambda: [offer.convert_date(d) for d in dates], dates),
+        # Without its memo cache, the benchmark's titles only differ in their card numbers
+        ("parse_quantity", lambda: [unit_price.parse_quantity.__wrapped__(t) for t in normalized], normalized),
+        ("offer_to_row", lambda: [csv_to_sql.offer_to_row(o) for o in all_offers], all_offers),
+        ("offers_to_rows", lambda: csv_to_sql.offers_to_rows(all_offers), all_offers),
+    ):
+        seconds, peak, _ = measure(fn, repeat)
+        record(stage, len(items), seconds, peak)
+
+    if dsn:
+        import psycopg2
+        conn = psycopg2.connect(dsn)
+        cur = conn.cursor()
+        cur.execute(BENCH_SCHEMA)
+        conn.commit()
+        csv_to_sql.ensure_sync_schema(cur, conn)
+        csv_to_sql.ensure_search_schema(cur, conn)
+        csv_to_sql.ensure_unit_schema(cur, conn)
+        csv_to_sql.ensure_history_schema(cur, conn)
+    else:
+        conn = StandInConnection()
+        cur = StandInCursor()
+
+    for stage, sync in (("converter", False), ("converter.sync", True)):
+        def load():
+            csv_to_sql.converter(list(offers), cur, conn, sources=offers, sync=sync)
+        seconds, peak, _ = measure(load, repeat)
+        record(stage, len(all_offers), seconds, peak)
+
+    if dsn:
+        cur.close()
+        conn.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the stages whose throughput dropped more than tolerance below the baseline."""
+    regressions = []
+    for stage, result in results.items():
+        base = baseline.get(stage)
+        if not base or not base.get("items_per_s") or not result["items_per_s"]:
+            continue
+        change = result["items_per_s"] / base["items_per_s"] - 1
+        result["vs_baseline"] = f"{change:+.1%}"
+        if change < -tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=10000, help="cards per shop page (default 10000)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one counts")
+    parser.add_argument("--dsn", help="PostgreSQL DSN of a throwaway database to run converter against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop before a regression")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--parser", help="tree builder to benchmark, e.g. html.parser (default: html_parsing.PARSER)")
+    parser.add_argument("--processes", type=int, default=extraction.PROCESSES,
+                        help="extraction processes of the parallel stages, 1 skips them (default: one per CPU)")
+    args = parser.parse_args()
+
+    if args.parser:
+        html_parsing.PARSER = args.parser
+
+    # converter prints progress for every load, keep the report readable
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        results = run(args.cards, args.repeat, args.dsn, args.processes)
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'stage':<20}{'items':>9}{'seconds':>10}{'items/s':>12}{'peak MB':>10}{'vs base':>10}")
+        for stage, r in results.items():
+            print(f"{stage:<20}{r['items']:>9}{r['seconds']:>10.3f}{r['items_per_s']:>12.0f}"
+                  f"{r['peak_mb']:>10.1f}{r.get('vs_baseline', '-'):>10}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+    elif not baseline:
+        print("No baseline to compare with, run with --save-baseline to create one")
+
+    if regressions:
+        print("Regressions:", ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+
+# Fonts are never needed to read offers, images are read from their src attributes only
+BLOCKED_URLS = ["*.woff", "*.woff2", "*.ttf", "*.otf"]
+
+
+def make_options():
+    """Headless Chrome options shared by every Selenium reader, with images disabled to cut page weight."""
+    opts = webdriver.ChromeOptions()
+    opts.add_argument("--headless=new")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--window-size=1920,1080")
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    return opts
+
+
+class BrowserPool:
+    """
+    Keeps up to size headless Chrome drivers alive and hands them out through driver().
+    Drivers are started lazily, reset and reused between shops, replaced after max_uses or
+    when they break, and all of them are quit by close().
+    """
+
+    def __init__(self, size=2, max_uses=20, options_factory=make_options):
+        self.size = size
+        self.max_uses = max_uses
+        self.options_factory = options_factory
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._live = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        # Resolved once, Selenium Manager finds (and caches) a matching chromedriver when no path is given
+        self._service_path = os.getenv("CHROMEDRIVER_PATH")
+
+    def _start_driver(self):
+        service = Service(self._service_path) if self._service_path else Service()
+        driver = webdriver.Chrome(service=service, options=self.options_factory())
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+        except WebDriverException:
+            pass  # blocking fonts is only an optimisation
+        return driver
+
+    def _acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+                if self._live < self.size:
+                    # Reserve the slot before the slow Chrome start so other threads can't overshoot size
+                    self._live += 1
+                    break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("No free browser in the pool")
+            try:
+                # Short waits so a slot freed by a discarded driver is noticed too
+                return self._idle.get(timeout=min(remaining, 1))
+            except queue.Empty:
+                continue
+
+        try:
+            return self._start_driver()
+        except Exception:
+            with self._lock:
+                self._live -= 1
+            raise
+
+    def _discard(self, driver):
+        with self._lock:
+            self._live -= 1
+            self._uses.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _release(self, driver, healthy):
+        with self._lock:
+            self._uses[driver] = self._uses.get(driver, 0) + 1
+            worn_out = self._uses[driver] >= self.max_uses
+            closed = self._closed
+
+        if not healthy or worn_out or closed:
+            self._discard(driver)
+            return
+
+        try:
+            # Leave nothing from the previous shop behind
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+        except Exception:
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def driver(self, timeout=300):
+        """
+        Borrows a driver for the duration of the with block. It is always returned to the pool,
+        or quit if the block failed with a WebDriver error.
+
+        :param timeout: seconds to wait for a free driver when all of them are busy
+        """
+        driver = self._acquire(timeout)
+        healthy = True
+        try:
+            yield driver
+        except WebDriverException:
+            healthy = False
+            raise
+        finally:
+            self._release(driver, healthy)
+
+    def close(self):
+        """Quits every driver, idle ones immediately and borrowed ones when they are returned."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns the process wide pool, sized by BROWSER_POOL_SIZE (default 2) and closed on exit."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = BrowserPool(size=int(os.getenv("BROWSER_POOL_SIZE", "2")))
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+def browser(timeout=300):
+    """Shortcut for get_pool().driver(), used by the readers as `with browser() as driver:`."""
+    return get_pool().driver(timeout)
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from http_cache import CACHE_DIR
+from offer import Offer
+from extraction import extract_cards, parallel
+import metrics
+
+# Reuse the offers of cards whose HTML is unchanged since the previous run, CARD_CACHE=0 turns it off
+ENABLED = os.getenv("CARD_CACHE", "1") != "0"
+STORE_PATH = CACHE_DIR / "cards.sqlite3"
+# Part of every fingerprint, bump it when a reader's offers change so cached offers are re-extracted
+OFFER_FORMAT = "3"
+
+# Attribute values may contain ">", so a tag runs to the first ">" outside quotes
+_ATTRS = r"""(?:[^>"']|"[^"]*"|'[^']*')*"""
+
+
+def card_start(tag, class_):
+    """
+    Pattern of the start tag of a card: a tag element with the class_ token (a regex, e.g. "a|b") in its class.
+    """
+    return re.compile(rf"""<{tag}\b(?=[^>]*\bclass=["'](?:[^"']*\s)?(?:{class_})["'\s])""" + _ATTRS + ">", re.I)
+
+
+@lru_cache(maxsize=None)
+def _tag_pattern(tag):
+    return re.compile(rf"<(/?){tag}\b{_ATTRS}>", re.I)
+
+
+def split_cards(html, start, tag):
+    """
+    Returns the outer HTML of every element whose start tag matches start, found by counting the tag's
+    opening and closing tags in the raw html, so no parse tree is built.
+
+    :param start: compiled pattern from card_start
+    :param tag: tag name of the cards
+    """
+    tags = _tag_pattern(tag)
+    cards = []
+    for match in start.finditer(html):
+        depth = 0
+        for t in tags.finditer(html, match.start()):
+            depth += -1 if t.group(1) else 1
+            if depth == 0:
+                cards.append(html[match.start():t.end()])
+                break
+        else:
+            cards.append(html[match.start():])
+    return cards
+
+
+def extract_page(html, start, tag, card_from_html, extract):
+    """
+    Offers of every card of the page, extracted in the extraction processes (see extraction.py).
+
+    :return: Offers in page order, empty when the page has too few cards to be worth sending
+             (or extraction runs in one process), the reader then parses the page itself
+    """
+    cards = split_cards(html, start, tag)
+    return extract_cards(cards, card_from_html, extract) if parallel(len(cards)) else []
+
+
+def fingerprint(card_html):
+    return hashlib.blake2b(card_html.encode(), digest_size=16, person=OFFER_FORMAT.encode()).hexdigest()
+
+
+class CardStore:
+    """SQLite file with each shop's card fingerprints of the previous run and the offers extracted from them."""
+
+    def __init__(self, path=STORE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cards (
+                shop TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                offer TEXT NOT NULL,
+                PRIMARY KEY (shop, fingerprint)
+            )
+            """
+        )
+        self._db.commit()
+
+    def load(self, shop):
+        with self._lock:
+            rows = self._db.execute("SELECT fingerprint, offer FROM cards WHERE shop = ?", (shop,)).fetchall()
+        return {fp: Offer.from_dict(json.loads(offer)) for fp, offer in rows}
+
+    def replace(self, shop, offers):
+        """Replaces the shop's stored cards with offers (fingerprint -> Offer)."""
+        with self._lock:
+            self._db.execute("DELETE FROM cards WHERE shop = ?", (shop,))
+            self._db.executemany(
+                "INSERT INTO cards (shop, fingerprint, offer) VALUES (?, ?, ?)",
+                [(shop, fp, json.dumps(offer.to_dict())) for fp, offer in offers.items()]
+            )
+            self._db.commit()
+
+
+class CardCache:
+    """
+    Offers of one shop's run. Cards are fingerprinted from their raw HTML, only new or changed ones
+    are parsed and extracted, the others are copied from the previous run. save() stores this run's
+    cards for the next one.
+    """
+
+    def __init__(self, shop, store=None):
+        self.shop = shop
+        self.store = store or get_store()
+        self.previous = self.store.load(shop)
+        self.current = {}
+
+    def offers(self, html, start, tag, card_from_html, extract, parse_page=None):
+        """
+        :param start, tag: how cards are found in the raw html, see split_cards
+        :param card_from_html: builds one card element from its HTML
+                               (card_from_html and extract are sent to the extraction processes for pages
+                               with many new cards, see extraction.py)
+        :param extract: the reader's card -> Offer function
+        :param parse_page: optional html -> card elements function, used instead of card_from_html
+                           when most cards are new, as one page parse is cheaper than many card parses
+        :return: Offers in page order, empty if no card was found
+        """
+        cards = split_cards(html, start, tag)
+        prints = [fingerprint(card_html) for card_html in cards]
+        new = sum(1 for fp in prints if fp not in self.current and fp not in self.previous)
+
+        elements = None
+        extracted = {}
+        if parallel(new):
+            pending = {fp: card_html for card_html, fp in zip(cards, prints)
+                       if fp not in self.current and fp not in self.previous}
+            extracted = dict(zip(pending, extract_cards(list(pending.values()), card_from_html, extract)))
+        elif parse_page and new * 2 > len(prints):
+            elements = parse_page(html)
+            if len(elements) != len(prints):
+                elements = None  # the parser sees other cards than the raw split, go card by card
+
+        offers = []
+        for i, (card_html, fp) in enumerate(zip(cards, prints)):
+            offer = self.current.get(fp) or self.previous.get(fp) or extracted.get(fp)
+            if offer is None:
+                offer = extract(elements[i] if elements is not None else card_from_html(card_html))
+            self.current[fp] = offer
+            offers.append(offer.copy())
+        metrics.add(self.shop, "cards_extracted", new)
+        metrics.add(self.shop, "cards_cached", len(offers) - new)
+        return offers
+
+    def save(self):
+        if self.current:
+            self.store.replace(self.shop, self.current)
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = CardStore()
+        return _default_store
+
+
+def card_cache(shop):
+    """CardCache for a shop's run, or None when CARD_CACHE=0."""
+    return CardCache(shop) if ENABLED else None
@@ -0,0 +1,126 @@
+"""
+Checkpoints of scraper runs, so a failed run's retry resumes instead of starting over.
+
+Paged readers (Rimi) store every page's offers as soon as the page is parsed, and a retry only fetches the
+pages that are missing. The runner stores each shop's complete offers before loading them, so a shop
+whose load failed is loaded again without scraping. Checkpoints are kept in an SQLite file, each one
+written in its own transaction, and are only resumed while they are younger than CHECKPOINT_MAX_AGE.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from http_cache import CACHE_DIR
+from offer import Offer
+
+# CHECKPOINTS=0 turns them off
+ENABLED = os.getenv("CHECKPOINTS", "1") != "0"
+STORE_PATH = CACHE_DIR / "checkpoints.sqlite3"
+# Seconds a checkpoint can be resumed for, offers change too often to reuse older ones
+MAX_AGE = int(os.getenv("CHECKPOINT_MAX_AGE", str(6 * 3600)))
+# Part name of a shop's complete offers, pages are stored as "page:<n>"
+COMPLETE = "complete"
+
+
+class CheckpointStore:
+    """SQLite file with the checkpointed offers of every shop, one row per part (page or complete run)."""
+
+    def __init__(self, path=STORE_PATH, max_age=MAX_AGE):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                shop TEXT NOT NULL,
+                part TEXT NOT NULL,
+                offers TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                PRIMARY KEY (shop, part)
+            )
+            """
+        )
+        self._db.commit()
+
+    def save(self, shop, part, offers):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (shop, part, offers, saved_at) VALUES (?, ?, ?, ?)",
+                (shop, part, json.dumps([o.to_dict() for o in offers]), time.time())
+            )
+
+    def load(self, shop):
+        """
+        :return: dictionary part -> Offers of the shop's checkpoints, expired ones are deleted
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM checkpoints WHERE saved_at < ?", (time.time() - self.max_age,))
+            rows = self._db.execute("SELECT part, offers FROM checkpoints WHERE shop = ?", (shop,)).fetchall()
+        return {part: [Offer.from_dict(o) for o in json.loads(offers)] for part, offers in rows}
+
+    def clear(self, shop, pages_only=False):
+        with self._lock, self._db:
+            if pages_only:
+                self._db.execute("DELETE FROM checkpoints WHERE shop = ? AND part LIKE 'page:%'", (shop,))
+            else:
+                self._db.execute("DELETE FROM checkpoints WHERE shop = ?", (shop,))
+
+
+class PageCheckpoint:
+    """A paged reader's checkpoint of one run: pages saved by an earlier, failed run and saving new ones."""
+
+    def __init__(self, shop, store):
+        self.shop = shop
+        self.store = store
+        self.pages = {
+            int(part.split(":", 1)[1]): offers
+            for part, offers in store.load(shop).items() if part.startswith("page:")
+        }
+        if self.pages:
+            print(f"Resuming {shop} from checkpoint, {len(self.pages)} pages already scraped")
+
+    def get(self, page_num):
+        """:return: the page's offers saved by the failed run, or None"""
+        return self.pages.get(page_num)
+
+    def save(self, page_num, offers):
+        self.store.save(self.shop, f"page:{page_num}", offers)
+
+    def done(self):
+        """Drops the pages once every one of them is scraped."""
+        self.store.clear(self.shop, pages_only=True)
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = CheckpointStore()
+        return _default_store
+
+
+def page_checkpoint(shop):
+    """PageCheckpoint for a paged reader's run, or None when CHECKPOINTS=0."""
+    return PageCheckpoint(shop, get_store()) if ENABLED else None
+
+
+def completed_offers(shop):
+    """:return: offers of the shop's last scrape that was not loaded, or None (also for an empty checkpoint)"""
+    return (get_store().load(shop).get(COMPLETE) or None) if ENABLED else None
+
+
+def save_completed(shop, offers):
+    """Stores the shop's scraped offers until they are loaded, a scrape without offers is not stored."""
+    if ENABLED and offers:
+        get_store().save(shop, COMPLETE, offers)
+
+
+def clear(shop):
+    if ENABLED:
+        get_store().clear(shop)
@@ -1,14 +1,26 @@
-import csv
 import psycopg2
-from datetime import datetime
 import unicodedata
-from iki_flyer_reader import scrape_iki_offers
-from lidl_flyer_reader import scrape_lidl_offers
-from maxima_flyer_reader import scrape_maxima_offers
-from rimi_flyer_reader import scrape_rimi_offers
+import re
+import io
+import hashlib
+from offer import read_csv
+from shop_registry import BROWSER, load_readers
+from http_cache import ShopUnchanged, get_cache
+from freshness import ensure_freshness_indexes, plan_refresh
+from search_tokens import search_tokens
+from unit_price import unit_fields
+from product_matching import ensure_group_schema, update_product_groups
+from image_mirror import get_mirror
+from price_history import append_from_staging, apply_retention, ensure_history_schema
+import checkpoints
+import metrics
 from dotenv import load_dotenv
 import os
+import sys
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain, islice
+from operator import attrgetter
 
 
 dotenv_path = Path(__file__).resolve().parent.parent / ".env"
@@ -16,62 +28,130 @@ load_dotenv(dotenv_path)
 
 # --------------------- DB helper functions ---------------------
 def scrape_date_check(shop, cur):
-    today = datetime.today().date()
+    """True if the shop's offers are stale according to its policy in freshness.POLICIES."""
+    return plan_refresh([shop], cur)[shop]["stale"]
 
-    if shop in ["iki", "maxima", "lidl"]:
+def ensure_sync_schema(cur, conn):
+    """
+    Adds what incremental syncs need if it is missing: offer_key / content_hash columns on main_offers
+    and the shop_sync_state table that keeps each shop's last sync time and change counts.
+    """
+    cur.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'main_offers' AND column_name IN ('offer_key', 'content_hash');
+        """
+    )
+    if len(cur.fetchall()) < 2:
         cur.execute(
             """
-            SELECT MIN(date_end)
-            FROM main_offers
-            WHERE date_end IS NOT NULL AND shop = %s;
-            """,
-            (shop,)
+            ALTER TABLE main_offers
+                ADD COLUMN IF NOT EXISTS offer_key text,
+                ADD COLUMN IF NOT EXISTS content_hash text;
+            """
         )
-        row = cur.fetchone()
-        min_end = row[0]  # date or None
-
-        if min_end is None:
-            return True  # no dated offers → scrape
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS main_offers_offer_key_idx ON main_offers (offer_key);")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS shop_sync_state (
+            shop text PRIMARY KEY,
+            synced_at timestamptz NOT NULL DEFAULT now(),
+            inserted integer NOT NULL DEFAULT 0,
+            updated integer NOT NULL DEFAULT 0,
+            deleted integer NOT NULL DEFAULT 0,
+            unchanged integer NOT NULL DEFAULT 0
+        );
+        """
+    )
+    conn.commit()
 
-        return min_end < today  # expired or expires today
-    else:  # rimi
+def ensure_search_schema(cur, conn):
+    """
+    Adds the search columns if they are missing: search_tokens (filled by the loader) and search_vector,
+    a stored tsvector of the normalised title and its tokens that PostgreSQL keeps up to date.
+    Both GIN indexes (full text and pg_trgm for ILIKE) are built in bulk when first created.
+    """
+    cur.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'main_offers' AND column_name IN ('search_tokens', 'search_vector');
+        """
+    )
+    if len(cur.fetchall()) < 2:
+        cur.execute("ALTER TABLE main_offers ADD COLUMN IF NOT EXISTS search_tokens text;")
         cur.execute(
-            "SELECT MAX(scraped_at) FROM main_offers WHERE shop = %s;",
-            (shop,)
+            """
+            ALTER TABLE main_offers ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                to_tsvector('simple', coalesce(title_normalized, '') || ' ' || coalesce(search_tokens, ''))
+            ) STORED;
+            """
         )
-        row = cur.fetchone()
-        last_scraped = row[0]  # datetime or None
-
-        if last_scraped is None:
-            return True
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    cur.execute("CREATE INDEX IF NOT EXISTS main_offers_search_vector_idx ON main_offers USING gin (search_vector);")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS main_offers_title_trgm_idx ON main_offers USING gin (title_normalized gin_trgm_ops);"
+    )
+    conn.commit()
 
-        return last_scraped.date() < today
+def ensure_unit_schema(cur, conn):
+    """
+    Adds the typed unit columns the loader fills from each offer's title, prices and discount text
+    (see unit_price.py) if they are missing, with the indexes the backend sorts and filters them by.
+    The columns are looked up first, ALTER TABLE locks out the backend's searches even when it changes nothing.
+    """
+    cur.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'main_offers' AND column_name IN ('quantity', 'unit', 'unit_price', 'discount_percent');
+        """
+    )
+    if len(cur.fetchall()) < 4:
+        cur.execute(
+            """
+            ALTER TABLE main_offers
+                ADD COLUMN IF NOT EXISTS quantity numeric(12, 6),
+                ADD COLUMN IF NOT EXISTS unit text,
+                ADD COLUMN IF NOT EXISTS unit_price integer,
+                ADD COLUMN IF NOT EXISTS discount_percent smallint;
+            """
+        )
+    cur.execute("CREATE INDEX IF NOT EXISTS main_offers_unit_price_idx ON main_offers (unit, unit_price);")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS main_offers_discount_percent_idx ON main_offers (discount_percent DESC NULLS LAST);"
+    )
+    conn.commit()
 
-def convert_date(d):
-    if not d or d.strip() == "" or "." not in d:
-        return None
-    
-    month, day = d.split(".")
-    year = datetime.now().year
-    
-    iso = f"{year}-{month}-{day}"
+def flush_search_index(cur, conn):
+    """
+    Moves the rows a load queued in the GIN indexes' pending lists into the indexes in one bulk pass,
+    so searches don't scan the pending list and no later insert pays for the merge.
+    Errors are only reported, the offers are already committed.
+    """
     try:
-        parsed = datetime.strptime(iso, "%Y-%m-%d").date()
-    except ValueError:
-        return None
-    
-    if parsed < datetime.now().date() and month != str(datetime.now().month):
-        parsed = parsed.replace(year=year + 1)
-
-    return parsed
+        cur.execute(
+            """
+            SELECT gin_clean_pending_list('main_offers_search_vector_idx'::regclass),
+                   gin_clean_pending_list('main_offers_title_trgm_idx'::regclass);
+            """
+        )
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print("Could not flush the search indexes:", e)
 
-def price_to_cents(s):
-    if "," in s:
-        s = s.replace(",", ".")
-    if not s or "." not in s:
-        return None
-    euros, cents = s.split(".")
-    return int(euros) * 100 + int(cents)
+def mark_shop_synced(shop, cur, conn):
+    """Records a sync for a shop whose offers were found unchanged, without touching main_offers."""
+    cur.execute(
+        """
+        INSERT INTO shop_sync_state (shop, synced_at, inserted, updated, deleted, unchanged)
+        VALUES (%s, now(), 0, 0, 0, (SELECT COUNT(*) FROM main_offers WHERE shop = %s))
+        ON CONFLICT (shop) DO UPDATE SET
+            synced_at = EXCLUDED.synced_at, inserted = 0, updated = 0, deleted = 0, unchanged = EXCLUDED.unchanged;
+        """,
+        (shop, shop)
+    )
+    conn.commit()
 
 def normalize(text: str) -> str:
     if text is None:
@@ -80,80 +160,492 @@ def normalize(text: str) -> str:
     text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
     return text.lower()
 
-def converter(names, cur, conn):
+# normalize_fast skips the per character category lookup for the characters titles are made of.
+# Latin letters that decompose into an ASCII letter plus combining marks (Lithuanian ą č ę ė į š ų ū ž
+# among them) lose everything but the ASCII letter, so titles of ASCII and such letters are decomposed
+# and ASCII encoded. Titles with other Latin letters and punctuation/currency signs (e.g. €, –)
+# whose decomposition only has combining diacritical marks (U+0300-U+036F) get those marks removed.
+COMBINING_MARKS = re.compile("[\u0300-\u036f]+")
+
+def _char_class(predicate, codepoints):
+    return "".join(re.escape(ch) for ch in map(chr, codepoints) if predicate(ch))
+
+def _strips_to_ascii(ch):
+    decomposed = unicodedata.normalize("NFD", ch)
+    return decomposed != ch and COMBINING_MARKS.sub("", decomposed).isascii()
+
+def _plain(ch):
+    return all(COMBINING_MARKS.fullmatch(c) or unicodedata.category(c) != "Mn"
+               for c in unicodedata.normalize("NFD", ch))
+
+NOT_ASCII_LETTERS = re.compile("[^\x00-\x7f" + _char_class(_strips_to_ascii, range(0x80, 0x250)) + "]")
+NOT_PLAIN = re.compile(
+    "[^\x00-\x7f" + _char_class(_plain, [*range(0x80, 0x250), *range(0x2000, 0x20d0)]) + "]"
+)
+
+def normalize_fast(text):
+    """Same result as normalize, see COMBINING_MARKS above. Anything unusual falls back to normalize."""
+    if text.isascii():
+        return text.lower()
+    if not NOT_ASCII_LETTERS.search(text):
+        return unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("ascii").lower()
+    if not NOT_PLAIN.search(text):
+        return COMBINING_MARKS.sub("", unicodedata.normalize("NFD", text)).lower()
+    return normalize(text)
+
+OFFER_COLUMNS = ("shop", "title", "title_normalized", "price", "old_price", "discount",
+                 "date_start", "date_end", "additional_info", "img", "search_tokens",
+                 "quantity", "unit", "unit_price", "discount_percent")
+
+def copy_value(value):
+    """
+    Formats one value for COPY ... FROM STDIN text format: None becomes \\N and
+    backslashes, tabs and newlines are escaped so they can't break the row.
+    """
+    if value is None:
+        return "\\N"
+    return (str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+# Rows sent to the DB per COPY, only one batch of converted rows is kept in memory at a time
+BATCH_SIZE = 5000
+
+def offer_to_row(offer):
+    """
+    Converts one scraped Offer (see offer.py) into a typed row in OFFER_COLUMNS order.
+    Missing text values become "" like they would after a CSV round trip, so both sources load identical rows.
+
+    :param offer: Offer from a reader or read_csv
+    :return: tuple ready for the DB
+    """
+    return offers_to_rows([offer])[0]
+
+def offers_to_rows(offers):
+    """
+    Batch version of offer_to_row: converts a list of offers column by column. Prices and dates were
+    parsed when the offers were scraped, the normalised title's search_tokens are added for the search
+    index, and the quantity, unit, price per unit and discount percent parsed from the title, prices and
+    discount text (Rimi's price_unit says a price is per kg).
+
+    :param offers: list of Offers
+    :return: list of tuples in OFFER_COLUMNS order
+    """
+    def column(field):
+        return ["" if v is None else v for v in map(attrgetter(field), offers)]
+
+    def values(field):
+        return list(map(attrgetter(field), offers))
+
+    titles = column("title")
+    normalized = [normalize_fast(t) for t in titles]
+    prices = values("price")
+    old_prices = values("old_price")
+    discounts = column("discount")
+    units = map(unit_fields, normalized, prices, old_prices, discounts, values("price_unit"))
+    return [row + unit_row for row, unit_row in zip(zip(
+        column("shop"),
+        titles,
+        normalized,
+        prices,
+        old_prices,
+        discounts,
+        values("date_start"),
+        values("date_end"),
+        column("additional_info"),
+        column("img"),
+        [search_tokens(t) for t in normalized],
+    ), units)]
+
+SYNC_COLUMNS = OFFER_COLUMNS + ("offer_key", "content_hash")
+
+def with_sync_keys(rows):
+    """
+    Adds a stable offer_key and a content_hash to every row for incremental syncs.
+    The key hashes (shop, title_normalized, date_start) plus the occurrence number of that triple,
+    since offers without a start date can repeat. Repeats of dated offers are dropped here, they would
+    be skipped by the (shop, title_normalized, date_start) constraint anyway.
+
+    :param rows: iterable of tuples in OFFER_COLUMNS order
+    :return: generator of tuples in SYNC_COLUMNS order
+    """
+    seen = {}
+    for row in rows:
+        shop, title_normalized, date_start = row[0], row[2], row[6]
+        ident = (shop, title_normalized, date_start)
+        occurrence = seen.get(ident, 0)
+        seen[ident] = occurrence + 1
+        if occurrence and date_start is not None:
+            continue
+
+        offer_key = hashlib.sha1(f"{shop}\x1f{title_normalized}\x1f{date_start}\x1f{occurrence}".encode()).hexdigest()
+        content = "\x1f".join("" if v is None else str(v) for v in row)
+        yield row + (offer_key, hashlib.sha1(content.encode()).hexdigest())
+
+def batched(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+def create_staging(cur, columns=OFFER_COLUMNS):
+    """
+    Creates the temporary offers_staging table with the same column types as main_offers
+    plus an ord column that keeps the scraped order. It is dropped on commit/rollback.
+    """
+    columns = ", ".join(columns)
+    cur.execute(
+        f"""
+        CREATE TEMP TABLE IF NOT EXISTS offers_staging ON COMMIT DROP AS
+        SELECT 0::integer AS ord, {columns} FROM main_offers WITH NO DATA;
+        """
+    )
+    cur.execute("TRUNCATE offers_staging;")
+
+def copy_rows(rows, cur, start=0, columns=OFFER_COLUMNS):
+    """
+    Streams rows into offers_staging with COPY FROM STDIN.
+
+    :param rows: list of tuples in the given columns order
+    :param cur: cursor of the open transaction
+    :param start: ord value of the first row, so consecutive batches keep their order
+    :param columns: staging columns the rows fill
+    """
+    columns = ", ".join(columns)
+    buf = io.StringIO()
+    for ord_num, row in enumerate(rows, start):
+        buf.write(str(ord_num) + "\t" + "\t".join(copy_value(v) for v in row) + "\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY offers_staging (ord, {columns}) FROM STDIN", buf)
+
+def merge_staging(cur):
+    """
+    Merges offers_staging into main_offers with one INSERT ... SELECT. Rows are inserted in scraped order,
+    so on duplicate (shop, title_normalized, date_start) keys the first row wins like it did with
+    row by row inserts.
+
+    :return: dictionary of shop -> number of rows inserted into main_offers
+    """
+    columns = ", ".join(OFFER_COLUMNS)
+    cur.execute(
+        f"""
+        WITH inserted AS (
+            INSERT INTO main_offers ({columns})
+            SELECT {columns} FROM offers_staging ORDER BY ord
+            ON CONFLICT (shop, title_normalized, date_start) DO NOTHING
+            RETURNING shop
+        )
+        SELECT shop, COUNT(*) FROM inserted GROUP BY shop;
+        """
+    )
+    return dict(cur.fetchall())
+
+def sync_staging(names, cur):
+    """
+    Applies offers_staging to main_offers incrementally for the given shops: offers whose key vanished
+    are deleted, offers whose content hash changed are updated in place and new keys are inserted.
+    Unchanged rows are not written, so their ids stay stable. Rows loaded before incremental syncs
+    have no offer_key and get replaced once. Each shop's counts and sync time go to shop_sync_state.
+
+    :return: dictionary of shop -> {"inserted", "updated", "deleted", "unchanged"} counts
+    """
+    columns = ", ".join(SYNC_COLUMNS)
+    counts = {name: {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0} for name in names}
+
+    def count(category):
+        for (shop,) in cur.fetchall():
+            counts[shop][category] += 1
+
+    cur.execute(
+        """
+        DELETE FROM main_offers m
+        WHERE m.shop = ANY(%s)
+        AND NOT EXISTS (SELECT 1 FROM offers_staging s WHERE s.offer_key = m.offer_key)
+        RETURNING m.shop;
+        """,
+        (list(names),)
+    )
+    count("deleted")
+
+    assignments = ", ".join(f"{c} = s.{c}" for c in SYNC_COLUMNS if c != "offer_key")
+    cur.execute(
+        f"""
+        UPDATE main_offers m SET {assignments}, scraped_at = now()
+        FROM offers_staging s
+        WHERE m.offer_key = s.offer_key AND m.content_hash IS DISTINCT FROM s.content_hash
+        RETURNING m.shop;
+        """
+    )
+    count("updated")
+
+    cur.execute(
+        f"""
+        INSERT INTO main_offers ({columns})
+        SELECT {columns} FROM offers_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM main_offers m WHERE m.offer_key = s.offer_key)
+        ORDER BY ord
+        ON CONFLICT (shop, title_normalized, date_start) DO NOTHING
+        RETURNING shop;
+        """
+    )
+    count("inserted")
+
+    cur.execute("SELECT shop, COUNT(*) FROM offers_staging GROUP BY shop;")
+    for shop, staged in cur.fetchall():
+        counts[shop]["unchanged"] = staged - counts[shop]["inserted"] - counts[shop]["updated"]
+
+    for name, c in counts.items():
+        cur.execute(
+            """
+            INSERT INTO shop_sync_state (shop, synced_at, inserted, updated, deleted, unchanged)
+            VALUES (%s, now(), %s, %s, %s, %s)
+            ON CONFLICT (shop) DO UPDATE SET
+                synced_at = EXCLUDED.synced_at, inserted = EXCLUDED.inserted, updated = EXCLUDED.updated,
+                deleted = EXCLUDED.deleted, unchanged = EXCLUDED.unchanged;
+            """,
+            (name, c["inserted"], c["updated"], c["deleted"], c["unchanged"])
+        )
+
+    return counts
+
+def converter(names, cur, conn, sources=None, batch_size=BATCH_SIZE, sync=False):
+    """
+    Loads the offers of every shop in names inside one transaction. Offers are converted and
+    copied to the staging table in batches while they are read, then either replace the shop's rows
+    (DELETE + merge) or, with sync, are applied incrementally by sync_staging. The same transaction
+    appends the loaded offers to the price history (see price_history.py).
+
+    :param names: shop names to load
+    :param sources: optional dictionary of shop -> iterable of Offers (e.g. a reader's iter_*_offers
+                    generator). Shops missing from it are read from their CSV file.
+    :param batch_size: rows per COPY batch
+    :param sync: only insert new, update changed and delete vanished offers (needs ensure_sync_schema)
+    """
     total_rows = 0
+    columns = SYNC_COLUMNS if sync else OFFER_COLUMNS
+    loaded = []
+    staged = {}
     try:
+        create_staging(cur, columns)
         for name in names:
-            print(f"Converting {name}_offers.csv to SQL")
-            with open(f"../Flyer_reader/{name}_offers.csv", "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                rows = []
-
-                for r in reader:
-                    rows.append((
-                        r["shop"],
-                        r["title"],
-                        normalize(r["title"]),
-                        price_to_cents(r["price"]) if r["price"] else None,
-                        price_to_cents(r["old_price"]) if r["old_price"] else None,
-                        r["discount"],
-                        convert_date(r["date_start"]) if r["date_start"] else None,
-                        convert_date(r["date_end"]) if r["date_end"] else None,
-                        r["additional_info"],
-                        r["img"],
-                    ))
-            if rows:
-                cur.execute("DELETE FROM main_offers WHERE shop = %s;", (name,))
-                total_rows += len(rows)
-
-                cur.executemany(
-                    """
-                    INSERT INTO main_offers
-                    (shop, title, title_normalized, price, old_price, discount,
-                    date_start, date_end, additional_info, img)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (shop, title_normalized, date_start) DO NOTHING;
-                    """, rows
-                )
+            if sources is not None and name in sources:
+                print(f"Loading {name} offers to SQL")
+                offers = sources[name]
+            else:
+                print(f"Converting {name}_offers.csv to SQL")
+                offers = read_csv(name)
+
+            rows = chain.from_iterable(map(offers_to_rows, batched(offers, batch_size)))
+            if sync:
+                rows = with_sync_keys(rows)
+            rows = metrics.timed_iter(name, "normalize", rows)
+
+            shop_rows = 0
+            for batch in batched(rows, batch_size):
+                if shop_rows == 0:
+                    loaded.append(name)
+                    if not sync:
+                        cur.execute("DELETE FROM main_offers WHERE shop = %s;", (name,))
+                with metrics.stage(name, "db_load"):
+                    copy_rows(batch, cur, start=total_rows, columns=columns)
+                shop_rows += len(batch)
+                total_rows += len(batch)
+            staged[name] = shop_rows
 
         if total_rows == 0:
             raise Exception("No scraped Data - Aborting DB changes")
 
-        conn.commit()
-        print(f"Committed {total_rows} rows")
+        # The merge covers every loaded shop, its time is only attributed to a shop loaded on its own
+        merge_shop = loaded[0] if len(loaded) == 1 else "all"
+
+        if sync:
+            with metrics.stage(merge_shop, "db_load"):
+                counts = sync_staging(loaded, cur)
+                history = append_from_staging(cur)
+                conn.commit()
+                flush_search_index(cur, conn)
+            metrics.add(merge_shop, "history_rows", history)
+            for name, c in counts.items():
+                print(f"Synced {name}: {c['inserted']} inserted, {c['updated']} updated, "
+                      f"{c['deleted']} deleted, {c['unchanged']} unchanged")
+                metrics.add(name, "rows_inserted", c["inserted"])
+                metrics.add(name, "rows_updated", c["updated"])
+                metrics.add(name, "rows_deleted", c["deleted"])
+                metrics.add(name, "rows_skipped", c["unchanged"])
+            return counts
+
+        with metrics.stage(merge_shop, "db_load"):
+            inserted = merge_staging(cur)
+            history = append_from_staging(cur)
+            conn.commit()
+            flush_search_index(cur, conn)
+        metrics.add(merge_shop, "history_rows", history)
+        for name in loaded:
+            metrics.add(name, "rows_inserted", inserted.get(name, 0))
+            metrics.add(name, "rows_skipped", staged[name] - inserted.get(name, 0))
+        inserted = sum(inserted.values())
+        print(f"Committed {total_rows} rows ({inserted} inserted, {total_rows - inserted} duplicates skipped)")
     except Exception as e:
         conn.rollback()
         print("Rollback due to error:", e)
         raise
 
 # --------------------- Main runner ---------------------
-def run_scrapers_and_update_db():
+# Reader of every shop (see shop_registry.py), by the shop name its offers are stored under
+SHOPS = load_readers()
+
+def connect():
+    return psycopg2.connect(f'dbname=grocery_discounts user=postgres password={os.getenv("POSTGRESQL_PASSWORD")}')
+
+def run_scrapers_and_update_db(max_workers=None, save_csv=None, sync=None, shops=None, force=False, conn=None):
+    """
+    Checks which shops have stale offers and scrapes them concurrently in a thread pool.
+    Each shop is loaded into the DB as soon as its scraper finishes, in its own transaction,
+    so one shop failing (scraping or loading) does not discard the others. Scraped offers are
+    checkpointed until they are loaded and paged readers checkpoint every page (see checkpoints.py),
+    so the retry of a failed shop picks up where it stopped.
+
+    Scraped offers are passed to the loader in memory, the CSV files are only written
+    when save_csv is set (or SAVE_OFFERS_CSV=1) for debugging.
+
+    :param max_workers: maximum number of scrapers running at once,
+                        defaults to the SCRAPER_MAX_WORKERS env variable or 4
+    :param save_csv: also write each shop's <shop>_offers.csv
+    :param sync: load incrementally instead of replacing each shop's rows,
+                 defaults to the INCREMENTAL_SYNC env variable (on unless set to 0)
+    :param shops: names of the shops to check, defaults to every shop in SHOPS
+    :param force: scrape the shops even if the freshness plan finds their offers fresh
+    :param conn: open DB connection to reuse (and leave open), a new one is made and closed if not given
+    :return: dictionary of shop -> error message for every shop that failed
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv("SCRAPER_MAX_WORKERS", "4"))
+    if save_csv is None:
+        save_csv = os.getenv("SAVE_OFFERS_CSV") == "1"
+    if sync is None:
+        sync = os.getenv("INCREMENTAL_SYNC", "1") != "0"
+
+    run_metrics = metrics.new_run()
+
     # Connect to DB
-    conn = psycopg2.connect(f'dbname=grocery_discounts user=postgres password={os.getenv("POSTGRESQL_PASSWORD")}')
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
     cur = conn.cursor()
+    ensure_sync_schema(cur, conn)
+    ensure_search_schema(cur, conn)
+    ensure_unit_schema(cur, conn)
+    ensure_freshness_indexes(cur, conn)
+    ensure_group_schema(cur, conn)
+    ensure_history_schema(cur, conn)
 
-    shop_list = {
-        "lidl": scrape_lidl_offers,
-        "maxima": scrape_maxima_offers,
-        "iki": scrape_iki_offers,
-        "rimi": scrape_rimi_offers
-    }
+    # Staleness of every shop is decided up front, in one query
+    shops = list(SHOPS) if shops is None else shops
+    plan = plan_refresh(shops, cur)
+    for shop, entry in plan.items():
+        print(f"{shop}: {'refresh' if entry['stale'] or force else 'fresh'} ({entry['reason']})")
+    stale_shops = [shop for shop in shops if force or plan[shop]["stale"]]
+    failed = {}
+    updated = []
 
-    shops_to_insert = []
+    def scrape(shop):
+        offers = checkpoints.completed_offers(shop)
+        if offers:
+            print(f"Loading the {shop} offers scraped by a previous run that failed to load them")
+            metrics.set_value(shop, "resumed", 1)
+            return offers
 
-    for shop, scrape_fn in shop_list.items():
-        if scrape_date_check(shop, cur):
-            scrape_fn()
-            shops_to_insert.append(shop)
+        with metrics.stage(shop, "scrape"):
+            offers = SHOPS[shop].scrape(save_csv=save_csv)
+        # Runs on the scraper's thread, so one shop's images download while others scrape or load
+        mirror = get_mirror()
+        if mirror:
+            try:
+                mirror.mirror(shop, offers)
+            except Exception as e:
+                print(f"Mirroring {shop} images failed, keeping their remote URLs:", e)
+        # Kept until the offers are loaded, a failed load is retried without scraping again. A scrape that found
+        # no offers is not kept, its retry scrapes again
+        if offers:
+            checkpoints.save_completed(shop, offers)
+        return offers
 
-    if shops_to_insert:
-        converter(shops_to_insert, cur, conn)
-    else:
+    if not stale_shops:
         print("No shops required scraping!")
+    else:
+        # Scrapers only touch the network (and their own CSV file), the DB connection
+        # stays on this thread and is used as each scraper completes.
+        # Browser shops are submitted first: they are the slowest and wait for a pooled Chrome driver,
+        # the plain HTTP shops fill the remaining workers
+        order = sorted(stale_shops, key=lambda shop: shop not in SHOPS or SHOPS[shop].fetch != BROWSER)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            futures = {pool.submit(scrape, shop): shop for shop in order}
+
+            for future in as_completed(futures):
+                shop = futures[future]
+                try:
+                    offers = future.result()
+                except ShopUnchanged as e:
+                    print(f"Skipping {shop}:", e)
+                    mark_shop_synced(shop, cur, conn)
+                    metrics.set_value(shop, "status", "unchanged")
+                    continue
+                except Exception as e:
+                    print(f"Scraping {shop} failed:", e)
+                    failed[shop] = str(e)
+                    metrics.set_value(shop, "status", "scrape_failed")
+                    continue
+
+                try:
+                    converter([shop], cur, conn, sources={shop: offers}, sync=sync)
+                    metrics.set_value(shop, "status", "ok")
+                    updated.append(shop)
+                    checkpoints.clear(shop)
+                except Exception as e:
+                    failed[shop] = str(e)
+                    metrics.set_value(shop, "status", "load_failed")
+                    # Only a lost connection is worth loading the same offers again, offers the load
+                    # rejected are scraped again by the retry
+                    if not isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                        checkpoints.clear(shop)
+
+        loaded = [shop for shop in stale_shops if shop not in failed]
+        print(f"Updated shops: {loaded or 'none'}, failed shops: {list(failed) or 'none'}")
+
+    # Product groups span shops, so they are recomputed over all offers once the loads are done
+    if updated:
+        try:
+            with metrics.stage("all", "match"):
+                groups = update_product_groups(cur, conn)
+            metrics.set_value("all", "product_groups", groups)
+            print(f"Matched offers into {groups} product groups")
+        except Exception as e:
+            print("Product matching failed:", e)
+
+        dropped = apply_retention(cur, conn)
+        if dropped:
+            print(f"Compacted price history partitions: {dropped}")
+
+    cache = get_cache()
+    if cache:
+        print("HTTP cache:", cache.stats)
+
+    try:
+        run_metrics.emit()
+    except OSError as e:
+        print("Could not write run metrics:", e)
 
     cur.close()
-    conn.close()
+    if own_conn:
+        conn.close()
+    else:
+        # Ends the read transaction of the freshness checks, so a kept connection doesn't idle inside it
+        conn.rollback()
+    return failed
 
 # --------------------- Entry point ---------------------
 if __name__ == "__main__":
-    run_scrapers_and_update_db()
+    failed_shops = run_scrapers_and_update_db()
+    # Non-zero exit code lets the backend log that part of the refresh failed
+    sys.exit(1 if failed_shops else 0)
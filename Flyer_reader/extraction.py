@@ -0,0 +1,90 @@
+"""
+Card extraction over a process pool. Parsing card HTML and running the readers' selector chains is pure
+CPU work, so in one process it uses one core however many pages are fetched at once. Pages are split into
+their cards' raw HTML (see card_cache.split_cards), the cards are sent to the pool in chunks and every chunk
+comes back as Offers, in the cards' order. Only HTML strings and Offers cross the process boundary.
+
+EXTRACT_PROCESSES=1 extracts everything in the calling process, in order, with the readers' page parse.
+"""
+import math
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from process_pool import SpawnedPool
+
+# Extraction processes, one per CPU by default, 1 keeps extraction in the calling process
+PROCESSES = int(os.getenv("EXTRACT_PROCESSES", "0")) or os.cpu_count() or 1
+# Pages with fewer cards are extracted in the calling process, sending them costs more than it saves
+MIN_CARDS = 40
+# Chunks per process of a page's cards, more than one so a slow chunk does not hold up the others
+CHUNKS_PER_PROCESS = 2
+MIN_CHUNK = 16
+
+
+def parallel(cards, processes=None):
+    """True if cards number of cards are worth extracting in the pool."""
+    return (processes or PROCESSES) > 1 and cards >= MIN_CARDS
+
+
+def _extract_chunk(card_from_html, extract, card_htmls):
+    # Runs in a pool process, card_from_html and extract are looked up there by their module and name
+    return [extract(card_from_html(card_html)) for card_html in card_htmls]
+
+
+def chunks(items, processes):
+    size = max(MIN_CHUNK, math.ceil(len(items) / (processes * CHUNKS_PER_PROCESS)))
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+class Extractor:
+    """Extraction processes shared by the scraper threads, started on first use (see process_pool.py)."""
+
+    def __init__(self, processes=None):
+        self.processes = processes or PROCESSES
+        self._pool = SpawnedPool(self.processes)
+
+    def extract(self, card_htmls, card_from_html, extract):
+        """
+        :param card_htmls: outer HTML of each card
+        :param card_from_html: the reader's card HTML -> card element function, must be a module level function
+        :param extract: the reader's card -> Offer function, must be a module level function
+        :return: Offers in card_htmls order
+        """
+        if self.processes <= 1:
+            return _extract_chunk(card_from_html, extract, card_htmls)
+        try:
+            results = self._pool.get().map(
+                _extract_chunk, repeat(card_from_html), repeat(extract), chunks(card_htmls, self.processes)
+            )
+            return [offer for chunk in results for offer in chunk]
+        except BrokenProcessPool as e:
+            # These cards are extracted here, the next call starts a new pool
+            print("Extraction processes failed, extracting in this process:", e)
+            self._pool.discard()
+            return _extract_chunk(card_from_html, extract, card_htmls)
+
+    def close(self):
+        self._pool.close()
+
+
+_default_extractor = None
+_default_lock = threading.Lock()
+
+
+def get_extractor():
+    global _default_extractor
+    with _default_lock:
+        if _default_extractor is None:
+            _default_extractor = Extractor()
+        return _default_extractor
+
+
+def extract_cards(card_htmls, card_from_html, extract):
+    """Offers of the cards in order, see Extractor.extract."""
+    return get_extractor().extract(card_htmls, card_from_html, extract)
+
+
+def close_extractor():
+    if _default_extractor is not None:
+        _default_extractor.close()
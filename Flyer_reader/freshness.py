@@ -0,0 +1,79 @@
+from datetime import datetime
+
+# --------------------- Staleness policies ---------------------
+# A policy takes a shop's signals (min_date_end, last_scraped, synced_at) and today's date
+# and returns (stale, reason).
+
+def expired_offers(signals, today):
+    """For shops whose offers carry end dates: stale once the earliest end date has passed."""
+    min_end = signals["min_date_end"]
+    if min_end is None:
+        return True, "no dated offers"
+    if min_end < today:
+        return True, f"offers expired on {min_end}"
+    return False, f"offers valid until {min_end}"
+
+def scraped_before_today(signals, today):
+    """For shops without offer dates: stale unless scraped (or synced unchanged) today."""
+    # Incremental syncs leave unchanged rows untouched, so the last sync time counts as well
+    times = [t for t in (signals["last_scraped"], signals["synced_at"]) if t is not None]
+    if not times:
+        return True, "never scraped"
+    last = max(times)
+    if last.date() < today:
+        return True, f"last scraped {last:%Y-%m-%d %H:%M}"
+    return False, f"scraped today at {last:%H:%M}"
+
+# Policy of every shop, declared by its reader when it registers (see shop_registry.py).
+# Shops not listed here use DEFAULT_POLICY
+POLICIES = {}
+DEFAULT_POLICY = scraped_before_today
+
+def register_policy(shop, policy):
+    POLICIES[shop] = policy
+
+# --------------------- Planner ---------------------
+def ensure_freshness_indexes(cur, conn):
+    """Indexes that turn the MIN(date_end) / MAX(scraped_at) lookups into one index probe per shop."""
+    cur.execute("CREATE INDEX IF NOT EXISTS main_offers_shop_date_end_idx ON main_offers (shop, date_end);")
+    cur.execute("CREATE INDEX IF NOT EXISTS main_offers_shop_scraped_at_idx ON main_offers (shop, scraped_at);")
+    conn.commit()
+
+def fetch_signals(shops, cur):
+    """
+    Reads the staleness signals of every shop in one query. The per shop MIN / MAX subqueries
+    are answered from the (shop, date_end) and (shop, scraped_at) indexes instead of a scan.
+
+    :return: dictionary of shop -> {"min_date_end", "last_scraped", "synced_at"}
+    """
+    cur.execute(
+        """
+        SELECT s.shop,
+            (SELECT MIN(m.date_end) FROM main_offers m WHERE m.shop = s.shop),
+            (SELECT MAX(m.scraped_at) FROM main_offers m WHERE m.shop = s.shop),
+            st.synced_at
+        FROM unnest(%s::text[]) AS s(shop)
+        LEFT JOIN shop_sync_state st ON st.shop = s.shop;
+        """,
+        (list(shops),)
+    )
+    return {
+        shop: {"min_date_end": min_end, "last_scraped": last_scraped, "synced_at": synced_at}
+        for shop, min_end, last_scraped, synced_at in cur.fetchall()
+    }
+
+def plan_refresh(shops, cur, today=None):
+    """
+    Decides which shops need scraping before any scraper starts.
+
+    :param shops: shop names to check
+    :param today: date to check against, defaults to today
+    :return: dictionary of shop -> {"stale": bool, "reason": str, "signals": dict}, in shops order
+    """
+    today = today or datetime.today().date()
+    signals = fetch_signals(shops, cur)
+    plan = {}
+    for shop in shops:
+        stale, reason = POLICIES.get(shop, DEFAULT_POLICY)(signals[shop], today)
+        plan[shop] = {"stale": stale, "reason": reason, "signals": signals[shop]}
+    return plan
@@ -0,0 +1,54 @@
+import os
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve
+
+
+def _pick_parser():
+    """
+    Picks the tree builder used by every reader. lxml (C-backed) is used when installed,
+    otherwise the pure python html.parser. FLYER_HTML_PARSER env variable forces a specific one
+    (e.g. "html.parser" to compare results with the old behaviour).
+    """
+    forced = os.getenv("FLYER_HTML_PARSER")
+    if forced:
+        return forced
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+PARSER = _pick_parser()
+
+
+def make_soup(html, only=None, parser=None):
+    """
+    Parses html with the selected parser backend.
+
+    :param html: raw html string
+    :param only: optional SoupStrainer, only matching elements (and their children) are built into the tree
+    :param parser: overrides the module default parser
+    :return: BeautifulSoup object
+    """
+    return BeautifulSoup(html, parser or PARSER, parse_only=only)
+
+
+def strainer(name=None, class_=None, **attrs):
+    """
+    Shortcut for a SoupStrainer, e.g. strainer("ul", class_="product-grid").
+    class_ matches a single class token, the strainer sees the raw class attribute while
+    parsing so "product-grid x" has to match as well.
+    """
+    if class_:
+        attrs["class"] = re.compile(rf"(^|\s){re.escape(class_)}(\s|$)")
+    return SoupStrainer(name, attrs)
+
+
+def compile_selector(selector):
+    """
+    Compiles a CSS selector once so it can be reused for every card with
+    .select_one(card) / .select(card) instead of re-parsing the selector string each call.
+    """
+    return soupsieve.compile(selector)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", Path(__file__).resolve().parent / ".http_cache"))
+# Seconds a stored response is served without asking the server, 0 revalidates every request
+CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", "0"))
+CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+# Early exit for readers: skip a shop when its first page is byte-identical to the previous run
+SKIP_UNCHANGED = os.getenv("SKIP_UNCHANGED_SHOPS", "0") == "1"
+
+
+class ShopUnchanged(Exception):
+    """Raised by a reader when its first page is identical to the previous run, so nothing needs reloading."""
+
+
+class ResponseCache:
+    """
+    Disk backed cache of GET response bodies. Bodies are stored as files named by the url hash,
+    an SQLite index keeps their validators (ETag / Last-Modified), age and last access time.
+    The least recently used entries are evicted once the bodies exceed max_bytes.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.directory / "index.sqlite3", check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    def _body_path(self, key):
+        return self.directory / f"{key}.body"
+
+    def lookup(self, url):
+        """
+        :return: dictionary with the stored entry (body included) and whether it is still fresh, or None
+        """
+        key = self.key(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, headers, digest, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                body = self._body_path(key).read_bytes()
+            except OSError:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+
+        etag, last_modified, headers, digest, stored_at = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": json.loads(headers),
+            "digest": digest,
+            "body": body,
+            "fresh": time.time() - stored_at < self.ttl,
+        }
+
+    def store(self, url, headers, body):
+        key = self.key(url)
+        now = time.time()
+        # Written to a temp file of its own, threads storing the same url don't write into each other's file
+        tmp = tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{key}.", suffix=".tmp", delete=False)
+        try:
+            with tmp:
+                tmp.write(body)
+        except OSError:
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            # Moved in place under the lock, so the body file matches the entry written with it
+            os.replace(tmp.name, self._body_path(key))
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO entries
+                (key, url, etag, last_modified, headers, digest, size, stored_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, url, headers.get("ETag"), headers.get("Last-Modified"),
+                 json.dumps({"Content-Type": headers.get("Content-Type", "")}),
+                 hashlib.sha1(body).hexdigest(), len(body), now, now)
+            )
+            self._db.commit()
+            self.stats["stored"] += 1
+            self._evict()
+
+    def count(self, stat):
+        """Adds one to stats[stat], the adapter counts from every thread sharing the cache."""
+        with self._lock:
+            self.stats[stat] += 1
+
+    def touch(self, url):
+        """Marks an entry as just validated (after a 304), restarting its TTL."""
+        with self._lock:
+            self._db.execute("UPDATE entries SET stored_at = ? WHERE key = ?", (time.time(), self.key(url)))
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            try:
+                self._body_path(key).unlink()
+            except OSError:
+                pass
+            total -= size
+            self.stats["evicted"] += 1
+        self._db.commit()
+
+    def digest(self, url):
+        """sha1 of the stored body for url, None if it isn't cached."""
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM entries WHERE key = ?", (self.key(url),)).fetchone()
+        return row[0] if row else None
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that answers GET requests from a ResponseCache. Fresh entries are returned without a request,
+    stale ones are revalidated with If-None-Match / If-Modified-Since and a 304 is turned into the cached body.
+    Responses served from the cache have from_cache set to True.
+    """
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def _cached_response(self, request, entry):
+        resp = Response()
+        resp.status_code = 200
+        resp.reason = "OK"
+        resp._content = entry["body"]
+        resp.headers = CaseInsensitiveDict(entry["headers"])
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        resp.from_cache = True
+        return resp
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        entry = self.cache.lookup(request.url)
+        if entry and entry["fresh"]:
+            self.cache.count("hits")
+            return self._cached_response(request, entry)
+
+        if entry:
+            if entry["etag"]:
+                request.headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                request.headers["If-Modified-Since"] = entry["last_modified"]
+
+        resp = super().send(request, **kwargs)
+
+        if resp.status_code == 304 and entry:
+            self.cache.count("revalidated")
+            self.cache.touch(request.url)
+            return self._cached_response(request, entry)
+
+        self.cache.count("misses")
+        resp.from_cache = False
+        if resp.status_code == 200:
+            self.cache.store(request.url, resp.headers, resp.content)
+        return resp
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the process wide cache, or None when HTTP_CACHE=0 disables caching."""
+    global _default_cache
+    if os.getenv("HTTP_CACHE", "1") == "0":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
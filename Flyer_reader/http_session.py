@@ -0,0 +1,80 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http_cache import CachingAdapter, get_cache
+import metrics
+
+# Seconds to wait for a connection / response before giving up on a request
+REQUEST_TIMEOUT = 20
+
+# How the Selenium based readers get their pages: "browser" renders them in Chrome,
+# "http" reads the server rendered HTML / embedded structured data and only falls back to Chrome
+# when no offers are found in it
+FETCH_MODE = os.getenv("SCRAPER_FETCH_MODE", "browser")
+
+# Browser-like headers for plain HTTP fetches of pages normally opened in Chrome
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0 Safari/537.36",
+    "Accept-Language": "lt-LT,lt;q=0.9,en-US;q=0.8,en;q=0.7",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+
+def make_session(headers=None, pool_size=10, retries=3, backoff=0.5, cache=True):
+    """
+    Creates a requests Session that keeps connections alive between requests and
+    retries failed GET requests (connection errors, 429 and 5xx responses) with exponential backoff.
+
+    :param headers: default headers sent with every request
+    :param pool_size: number of kept-alive connections per host, should match the number of threads using the session
+    :param retries: how many times a request is retried before failing
+    :param backoff: backoff factor in seconds, waits backoff * 2^(retry - 1) between retries
+    :param cache: True for the shared disk cache (unless HTTP_CACHE=0), False for none, or a ResponseCache
+    :return: configured requests.Session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        raise_on_status=False,
+    )
+    if cache is True:
+        cache = get_cache()
+    if cache:
+        adapter = CachingAdapter(cache, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def record_response(shop, r):
+    """Adds the response's body size to the shop's html_bytes, and to bytes_downloaded unless it came from the cache."""
+    metrics.add(shop, "html_bytes", len(r.content))
+    if not getattr(r, "from_cache", False):
+        metrics.add(shop, "bytes_downloaded", len(r.content))
+
+
+def fetch_html(url, session=None, shop=None):
+    """
+    Fetches a page with a plain GET request, raising an error on non 200 responses.
+
+    :param session: session to reuse, a new one with BROWSER_HEADERS is made if not given
+    :param shop: shop the fetch time and bytes are recorded for in the run metrics
+    :return: response text
+    """
+    if session is None:
+        session = make_session(headers=BROWSER_HEADERS)
+    with metrics.stage(shop, "fetch"):
+        r = session.get(url, timeout=REQUEST_TIMEOUT)
+    if r.status_code != 200:
+        raise Exception(f"Failed to fetch {url}, status code: {r.status_code}")
+    record_response(shop, r)
+    return r.text
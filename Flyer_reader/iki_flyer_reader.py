@@ -1,10 +1,29 @@
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-import time
-import csv
+from html_parsing import make_soup, strainer, compile_selector
+from card_cache import card_start, extract_page
+from page_waits import scroll_until_loaded
+from browser_pool import browser
+from structured_data import read_shop_offers
+from offer import Offer, save_csv as save_offers_csv
+from shop_registry import BROWSER, register_shop
+from freshness import expired_offers
+import metrics
+
+URL = "https://iki.lt/akcijos/savaites-akcijos/"
+CARD_SELECTOR = 'div[data-content="promotions"] div.tag_class-savaites-akcijos'
+# Start tag of a promotion card in the raw page html, for fingerprinting cards without parsing the page
+CARD_START = card_start("div", "tag_class-savaites-akcijos")
+
+# Only the promotions container is built into the parse tree, selectors are compiled once and scoped to each card
+PROMOTIONS_ONLY = strainer("div", **{"data-content": "promotions"})
+TITLE = compile_selector("p.akcija_title")
+IMAGE = compile_selector("img.card-img-top")
+PRICE_BLOCK = compile_selector(".price_block_wrapper")
+PRICE_INT = compile_selector(".price_int")
+PRICE_CENTS = compile_selector(".price_cents span.sub")
+OLD_PRICE = compile_selector(".price_old_block")
+EXTRA_PROMO = compile_selector(".price_block_rounded_red_wrapper, .price_block_red_wrapper")
+STORE_LIMITER = compile_selector(".akcija__wrap-top > .promo-top-wrapper > .promo_bottom_item > .store-list-item__hearts img")
+DESCRIPTION = compile_selector(".m-0.w-100.akcija_description.text-center")
 
 
 def is_percentage(text):
@@ -12,124 +31,144 @@ def is_percentage(text):
         return False
     return "%" in text or text.replace(" ", "").startswith("-") and text.endswith("%")
 
-def save_to_csv(offers):
-    with open("../Flyer_reader/iki_offers.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["shop","title", "price","old_price","discount","date_start", "date_end","additional_info","img"])
-        writer.writeheader()
-        for item in offers:
-            writer.writerow(item)
+def render_page(url=URL):
+    """
+    Opens url in a pooled Chrome driver and scrolls until every promotion card is loaded.
+    The driver is handed back as soon as the page source is read.
+    """
+    with metrics.stage("iki", "fetch"), browser() as driver:
+        driver.get(url)
 
-def scrape_iki_offers():
-    # Launch Chrome with webdriver-manager
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
+        # Scroll until no new promotion cards load, continuing as soon as a new batch appears
+        count = scroll_until_loaded(driver, CARD_SELECTOR)
+        print(f"Finished loading all promotions ({count}).")
 
-    URL = "https://iki.lt/akcijos/savaites-akcijos/"
-    driver.get(URL)
-    time.sleep(1)
+        html = driver.page_source
 
+    metrics.add("iki", "html_bytes", len(html.encode()))
+    return html
 
-    # Scroll until no new content loads
-    scroll_pause = 2  # seconds
-    last_height = driver.execute_script("return document.body.scrollHeight")
+def iter_iki_offers(mode=None):
+    """
+    Generator version of the IKI scraper, yields one Offer per promotion card.
+    In "http" mode the page is fetched without a browser and read from its server rendered promotion cards,
+    or its JSON-LD data when it has none, Chrome is used when that finds no offers (see read_shop_offers).
 
-    while True:
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(scroll_pause)
+    :param mode: "browser" or "http", defaults to SCRAPER_FETCH_MODE
+    """
+    yield from read_shop_offers("iki", URL, render_page, page_offers, mode)
 
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
-            break  # fully loaded
-        last_height = new_height
+def parse_iki_offers(html):
+    """Yields one Offer per promotion card in the IKI promotions page html."""
+    for card in parse_cards(html):
+        yield extract_iki_card(card)
 
-    print("Finished loading all promotions.")
-
-    html = driver.page_source
-    soup = BeautifulSoup(html, "html.parser")
+def parse_cards(html):
+    """Returns the promotion cards of the page, raising an error if the promotions container is missing."""
+    soup = make_soup(html, only=PROMOTIONS_ONLY)
 
     # Find the container with all promotions
     cards_container = soup.find("div", {"data-content": "promotions"})
     if not cards_container:
         raise Exception("Promotions container not found")
 
-    cards = cards_container.find_all("div", class_="tag_class-savaites-akcijos")
+    return cards_container.find_all("div", class_="tag_class-savaites-akcijos")
+
+def card_from_html(card_html):
+    return make_soup(card_html).find("div", class_="tag_class-savaites-akcijos")
+
+def page_offers(html, cards=None):
+    """
+    Returns the offers of the page. With a CardCache only new or changed promotion cards are parsed
+    and extracted, a page it finds no cards in is parsed as a whole. Many cards are extracted in the
+    extraction processes (see extraction.py).
+    """
+    if cards:
+        offers = cards.offers(html, CARD_START, "div", card_from_html, extract_iki_card, parse_cards)
+    else:
+        offers = extract_page(html, CARD_START, "div", card_from_html, extract_iki_card)
+    return offers or list(parse_iki_offers(html))
+
+def extract_iki_card(card):
+    """Extracts the Offer of one promotion card."""
+    # Title
+    title_elem = TITLE.select_one(card)
+    title = title_elem.get_text(strip=True) if title_elem else None
+    
+    # Image
+    img_src = IMAGE.select_one(card)
+    img = img_src['src'] if img_src and img_src.has_attr('src') else None
+
+
+    # Price & Discount Logic
+    price = None
+    discount = ""
+    additional_info = ""
+    old_price = None
+
+    price_block = PRICE_BLOCK.select_one(card)
+
+    if price_block:
+        raw_text = price_block.get_text(" ", strip=True)
+
+        # Case 1: This is actually a discount, not a price (e.g. "-30%")
+        if is_percentage(raw_text):
+            discount = "".join(raw_text)
+            price = None
+
+        else:
+            # Try extracting normal price (2.99 format)
+            try:
+                price_int = PRICE_INT.select_one(price_block).text.strip()
+                price_cents = PRICE_CENTS.select_one(price_block).text.strip()
+                price = f"{int(price_int)}.{int(price_cents):02d}"
+            except:
+                price = None
 
-    items = []
-    for card in cards:
-        # Title
-        title_elem = card.select_one("p.akcija_title")
-        title = title_elem.get_text(strip=True) if title_elem else None
-        
-        # Image
-        img_src = card.select_one("img.card-img-top")
-        img = img_src['src'] if img_src and img_src.has_attr('src') else None
+        # Old price (if exists)
+        old_price_div = OLD_PRICE.select_one(price_block)
+        old_price = old_price_div.get_text(".", strip=True) if old_price_div else ""
 
 
-        # Price & Discount Logic
-        price = None
-        discount = ""
-        additional_info = ""
-        old_price = None
+    # Additional Info
+    # Extra promo info (like "Su pigintuvu -50%")
+    wrapper = EXTRA_PROMO.select_one(card)
+    extra_text = wrapper.get_text(" ", strip=True) if wrapper else ""
 
-        price_block = card.select_one(".price_block_wrapper")
+    if is_percentage(extra_text) and not discount:
+        discount = "".join(extra_text.split())
+    elif not discount:
+        if extra_text.startswith("Su pigintuvu"):
+            extra_texts = extra_text.split()
+            extra_text = (" ".join(extra_texts[:2]) + " " + ".".join(extra_texts[2:])) 
+        discount = extra_text
+    else:
+        additional_info = extra_text
 
-        if price_block:
-            raw_text = price_block.get_text(" ", strip=True)
+    store_limiter = STORE_LIMITER.select(card)
+    if store_limiter:
+        additional_info += (" " + ("X"*len(store_limiter)))
 
-            # Case 1: This is actually a discount, not a price (e.g. "-30%")
-            if is_percentage(raw_text):
-                discount = "".join(raw_text)
-                price = None
+    # Dates
+    split_parts = DESCRIPTION.select_one(card).text.strip().split()
+    item_active_date_start = split_parts[1]
+    item_active_date_end = split_parts[-1]
 
-            else:
-                # Try extracting normal price (2.99 format)
-                try:
-                    price_int = price_block.select_one(".price_int").text.strip()
-                    price_cents = price_block.select_one(".price_cents span.sub").text.strip()
-                    price = round(float(price_int) + float(price_cents) / 100, 2)
-                except:
-                    price = None
-
-            # Old price (if exists)
-            old_price_div = price_block.select_one(".price_old_block")
-            old_price = old_price_div.get_text(".", strip=True) if old_price_div else ""
-
-
-        # Additional Info
-        # Extra promo info (like "Su pigintuvu -50%")
-        wrapper = card.select_one(".price_block_rounded_red_wrapper, .price_block_red_wrapper")
-        extra_text = wrapper.get_text(" ", strip=True) if wrapper else ""
-
-        if is_percentage(extra_text) and not discount:
-            discount = "".join(extra_text.split())
-        elif not discount:
-            if extra_text.startswith("Su pigintuvu"):
-                extra_texts = extra_text.split()
-                extra_text = (" ".join(extra_texts[:2]) + " " + ".".join(extra_texts[2:])) 
-            discount = extra_text
-        else:
-            additional_info = extra_text
-
-        store_limiter = card.select(".akcija__wrap-top > .promo-top-wrapper > .promo_bottom_item > .store-list-item__hearts img")
-        if store_limiter:
-            additional_info += (" " + ("X"*len(store_limiter)))
-
-        # Dates
-        split_parts = card.select_one(".m-0.w-100.akcija_description.text-center").text.strip().split()
-        item_active_date_start = split_parts[1]
-        item_active_date_end = split_parts[-1]
-
-        # Appending List
-        items.append({"shop": "iki",
-                    "title": title,
-                    "price": price,
-                    "old_price": old_price,
-                    "discount": discount,
-                    "date_start": item_active_date_start,
-                    "date_end": item_active_date_end,
-                    "additional_info": additional_info,
-                    "img": img,
-                    })
-
-    # Quiting driver
-    driver.quit()
-    save_to_csv(items)
+    return Offer.from_text(
+        "iki", title, price, old_price, discount, item_active_date_start, item_active_date_end, additional_info, img
+    )
+
+
+def scrape_iki_offers(save_csv=True, mode=None):
+    """
+    Scrapes all IKI offers, optionally saving them to iki_offers.csv.
+
+    :return: list of all offers found
+    """
+    offers = list(iter_iki_offers(mode))
+    if save_csv:
+        save_offers_csv("iki", offers)
+    return offers
+
+
+register_shop("iki", scrape=scrape_iki_offers, parse=page_offers, fetch=BROWSER, policy=expired_offers)
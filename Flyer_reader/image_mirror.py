@@ -0,0 +1,219 @@
+"""
+Local mirror of the offer images. After a shop is scraped its new image URLs are downloaded concurrently,
+stored once per content hash as small WebP thumbnails under the backend's /images static route, and the
+offers' img values are pointed at them ("images/offers/<hash>.webp"). Images mirrored by an earlier run
+are not downloaded again.
+"""
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from http_cache import CACHE_DIR
+from http_session import BROWSER_HEADERS, REQUEST_TIMEOUT, make_session
+from process_pool import SpawnedPool
+import metrics
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# IMAGE_MIRROR=0 keeps the shops' own image URLs
+ENABLED = os.getenv("IMAGE_MIRROR", "1") != "0"
+IMAGE_DIR = Path(os.getenv(
+    "IMAGE_MIRROR_DIR", Path(__file__).resolve().parent.parent / "Discount_Combiner_backend" / "images" / "offers"
+))
+# img value of a mirrored image, relative to the backend's static root
+URL_PREFIX = "images/offers/"
+STORE_PATH = CACHE_DIR / "images.sqlite3"
+DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "8"))
+THUMBNAIL_PROCESSES = int(os.getenv("IMAGE_THUMBNAIL_PROCESSES", "0")) or os.cpu_count() or 1
+# Longest side of a thumbnail in pixels, the offer cards show images at most 160px high
+THUMBNAIL_SIZE = 320
+WEBP_QUALITY = 75
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def thumbnail_path(digest, directory=IMAGE_DIR):
+    return directory / f"{digest}.webp"
+
+
+def make_thumbnail(data, path):
+    """
+    Writes a WebP thumbnail of the image bytes to path. Runs in the thumbnail process pool.
+
+    :return: path as a string
+    """
+    path = Path(path)
+    # A temp file of its own, two scraper threads may convert the same image at once
+    tmp = tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False)
+    try:
+        with tmp, Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+            image.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+        os.replace(tmp.name, path)
+    except BaseException:
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
+    return str(path)
+
+
+class ImageStore:
+    """SQLite file mapping every mirrored image URL to the content hash of its thumbnail."""
+
+    def __init__(self, path=STORE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS images (url TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        self._db.commit()
+
+    def lookup(self, urls):
+        """:return: dictionary url -> content hash of the given urls that were mirrored before"""
+        found = {}
+        urls = list(urls)
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT url, hash FROM images WHERE url IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def add(self, hashes):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO images (url, hash) VALUES (?, ?)", hashes.items())
+            self._db.commit()
+
+
+class ImageMirror:
+    """
+    Mirrors the images of scraped offers into directory. Safe to share between the scraper threads,
+    downloads use one pooled session and thumbnails one process pool, started on first use (see process_pool.py).
+    """
+
+    def __init__(self, directory=IMAGE_DIR, store=None, session=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.store = store or ImageStore()
+        # The HTTP response cache is for pages, image bytes only pass through on their way to a thumbnail
+        self.session = session or make_session(headers=BROWSER_HEADERS, pool_size=DOWNLOAD_WORKERS, cache=False)
+        self._processes = SpawnedPool(THUMBNAIL_PROCESSES)
+
+    def _convert(self, shop, converting):
+        """Waits for the thumbnails being written (content hash -> future), failed ones are only counted."""
+        for digest, future in converting.items():
+            try:
+                future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                metrics.add(shop, "images_failed")
+                print(f"Could not convert {shop} image {digest}: {e}")
+
+    def _download(self, url):
+        r = self.session.get(url, timeout=REQUEST_TIMEOUT)
+        if r.status_code != 200 or not r.content:
+            raise Exception(f"status code {r.status_code}")
+        return r.content
+
+    def mirror(self, shop, offers):
+        """
+        Points the img of every offer at its local thumbnail, mirroring the images not seen before.
+        Images that fail to download or convert keep their remote URL.
+
+        :param offers: Offers, changed in place
+        :return: offers
+        """
+        urls = {o.img for o in offers if o.img and o.img.startswith(("http://", "https://"))}
+        if not urls:
+            return offers
+
+        with metrics.stage(shop, "images"):
+            local = {url: digest for url, digest in self.store.lookup(urls).items()
+                     if thumbnail_path(digest, self.directory).exists()}
+            new = [url for url in urls if url not in local]
+
+            # Each image is sent to the thumbnail processes as soon as it is downloaded, so downloads and
+            # conversions overlap and only the images still queued are held in memory
+            hashes = {}
+            converting = {}
+            downloaded_bytes = 0
+            try:
+                if new:
+                    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+                        futures = {pool.submit(self._download, url): url for url in new}
+                        for future in as_completed(futures):
+                            url = futures.pop(future)
+                            try:
+                                data = future.result()
+                            except Exception as e:
+                                metrics.add(shop, "images_failed")
+                                print(f"Could not download {shop} image {url}: {e}")
+                                continue
+                            downloaded_bytes += len(data)
+                            # Identical images behind different URLs are converted and stored once
+                            digest = hashes[url] = content_hash(data)
+                            if digest not in converting and not thumbnail_path(digest, self.directory).exists():
+                                converting[digest] = self._processes.get().submit(
+                                    make_thumbnail, data, thumbnail_path(digest, self.directory)
+                                )
+                    metrics.add(shop, "image_bytes_downloaded", downloaded_bytes)
+                self._convert(shop, converting)
+            except BrokenProcessPool as e:
+                print(f"Thumbnail processes of {shop} failed:", e)
+                self._processes.discard()
+            mirrored = {url: digest for url, digest in hashes.items()
+                        if thumbnail_path(digest, self.directory).exists()}
+            self.store.add(mirrored)
+            local.update(mirrored)
+
+        metrics.add(shop, "images_downloaded", len(hashes))
+        metrics.add(shop, "images_converted", len(converting))
+        metrics.add(shop, "images_reused", len(urls) - len(new))
+        for o in offers:
+            digest = local.get(o.img)
+            if digest:
+                o.img = URL_PREFIX + f"{digest}.webp"
+        return offers
+
+    def close(self):
+        self._processes.close()
+
+
+_default_mirror = None
+_default_lock = threading.Lock()
+_warned = False
+
+
+def get_mirror():
+    """Shared ImageMirror, or None when IMAGE_MIRROR=0 or Pillow is not installed."""
+    global _default_mirror, _warned
+    if not ENABLED:
+        return None
+    if Image is None:
+        if not _warned:
+            print("Pillow is not installed, offer images are not mirrored")
+            _warned = True
+        return None
+    with _default_lock:
+        if _default_mirror is None:
+            _default_mirror = ImageMirror()
+        return _default_mirror
+
+
+def close_mirror():
+    if _default_mirror is not None:
+        _default_mirror.close()
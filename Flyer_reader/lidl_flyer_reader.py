@@ -1,32 +1,37 @@
-import requests
-from bs4 import BeautifulSoup
 import re
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import time
-import csv
+from html_parsing import make_soup, strainer, compile_selector
+from card_cache import card_start, extract_page
+from page_waits import scroll_until_loaded
+from browser_pool import browser
+from http_session import fetch_html
+from structured_data import read_shop_offers
+from offer import Offer, save_csv as save_offers_csv
+from shop_registry import BROWSER, register_shop
+from freshness import expired_offers
+import metrics
 
 BASE = "https://www.lidl.lt"
 
-def save_to_csv(offers):
-    # Writing to CSV
-    with open("../Flyer_reader/lidl_offers.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["shop","title","price","old_price","discount","date_start","date_end","additional_info","img"])
-        writer.writeheader()
-        for o in offers:
-            writer.writerow(o)
-
+# Only product boxes are built into the parse tree, selectors are compiled once and scoped to each card
+BOX_ONLY = strainer(class_="product-grid-box")
+BOX = compile_selector(".product-grid-box")
+TITLE = compile_selector(".product-grid-box__title")
+PRICE_FOOTER = compile_selector("div.ods-price__footer")
+OLD_PRICE = compile_selector(".ods-price__stroke-price")
+NEW_PRICE = compile_selector(".ods-price__value")
+AVAILABILITY = compile_selector(".product-grid-box__availabilities")
+DISCOUNT = compile_selector(".ods-price__box-content-wrapper")
+ACTIVE_IMAGE = compile_selector(".odsc-image-gallery__item.odsc-image-gallery__item--active")
+# Start tag of a product box in the raw page html, for fingerprinting boxes without parsing the page
+CARD_START = card_start("div", "product-grid-box")
 
 def get_weekly_sales_url():
     """
     Accesses the Base url of Lidl Lithuania to find the current weeks sales url
     by accessing the a-tags href inside the div with name attribute "savaitės akcijos"
     """
-    html = requests.get(BASE).text
-    soup = BeautifulSoup(html, "html.parser")
+    html = fetch_html(BASE, shop="lidl")
+    soup = make_soup(html)
 
     # finding the div with name attribute that includes "savaitės akcijos" and throws error if not found
     div_node = soup.find("div", {"name": re.compile("savaitės akcijos", re.I)})
@@ -41,101 +46,128 @@ def get_weekly_sales_url():
     # returns the base url + the href found to provide the updated weekly sales url
     return BASE + link["href"]
 
-def scroll_to_bottom(driver, step=800, pause=0.2, max_no_change=4):
+def scroll_to_bottom(driver, step=800, max_no_change=4):
     """
     Imitate scrolling in order to allow all products to load on Lidl's website
-    in order to scrape all items.
+    in order to scrape all items. Scrolls step pixels at a time and moves on as soon as new
+    product boxes appear, stopping after max_no_change rounds without new ones at the bottom (or where the page stops scrolling).
     """
-    selector = ".product-grid-box"
-    last_count = 0
-    no_change_rounds = 0
-
-    while True:
-        # Scrolls steps and pauses for a set time (0.2s in this case)
-        driver.execute_script(f"window.scrollBy(0, {step});")
-        time.sleep(pause)
-
-        # Count loaded items in order to compare
-        items = driver.find_elements(By.CSS_SELECTOR, selector)
-        count = len(items)
-
-        # Condiional check to see if no new items are being loaded.
-        # Checks multiple times based on max_no_change parameter to see if end is actually reached
-        if count == last_count:
-            no_change_rounds += 1
-        else:
-            no_change_rounds = 0  # reset if new items arrived
+    return scroll_until_loaded(
+        driver,
+        ".product-grid-box",
+        scroll_script=f"window.scrollBy(0, {step});",
+        min_timeout=0.2,
+        max_timeout=3,
+        max_idle_rounds=max_no_change,
+    )
+
+
+def render_page(url):
+    """
+    Opens url in a pooled Chrome driver and scrolls until every product box is loaded.
+    The driver is handed back as soon as the page source is read.
+    """
+    # Run selenium to load JS content and run function to scroll to bottom
+    with metrics.stage("lidl", "fetch"), browser() as driver:
+        driver.get(url)
+
+        # Scroll to load all products (uses progressive loader above)
+        scroll_to_bottom(driver)
 
-        if no_change_rounds >= max_no_change:
-            break  # no more items loading
+        html = driver.page_source
 
-        last_count = count
+    metrics.add("lidl", "html_bytes", len(html.encode()))
+    return html
 
 
-def scrape_lidl_offers(url=None):
+def iter_lidl_offers(url=None, mode=None):
+    """
+    Generator version of the Lidl scraper, yields one Offer per product card.
+    In "http" mode the page is fetched without a browser and read from its server rendered product boxes,
+    or its JSON-LD data when it has none, Chrome is used when that finds no offers (see read_shop_offers).
+
+    :param mode: "browser" or "http", defaults to SCRAPER_FETCH_MODE
+    """
     # Gets the url for the updated weeks sales if not provided
     if url is None:
         url = get_weekly_sales_url()
 
-    # Run selenium to load JS content and run function to scroll to bottom
-    opts = webdriver.ChromeOptions()
-    opts.add_argument("--headless")  # runs Chrome in headless mode (no UI)
-    driver = webdriver.Chrome(options=opts)
-
-    driver.get(url)
-
-    # Scroll to load all products (uses progressive loader above)
-    scroll_to_bottom(driver)
-
-    html = driver.page_source
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Selecting all product areas
-    items = soup.select(".product-grid-box")  # adjust according to actual classes
-
-    # Iterating over all the product categories and extracting data and saving to list
-    offers = []
-    for item in items:
-        title_el = item.select_one(".product-grid-box__title")
-        title = title_el.get_text(strip=True) if title_el else ""
-        title += " " + item.select_one(".ods-price__footer").get_text(strip=True) if item.select_one("div.ods-price__footer") else ""
-        old_price_div = item.select_one('.ods-price__stroke-price')
-        old_price = old_price_div.get_text(strip=True).replace(",", ".")[:-1] if old_price_div else ""
-        new_price_div = item.select_one(".ods-price__value")
-        if new_price_div:
-            new_price = new_price_div.get_text(strip=True).replace(",", ".")[:-1]
+    yield from read_shop_offers("lidl", url, render_page, page_offers, mode)
+
+
+def parse_lidl_offers(html):
+    """Yields one Offer per product box in the Lidl offers page html."""
+    # Extracting data from each product area
+    for item in parse_boxes(html):
+        yield extract_lidl_card(item)
+
+
+def parse_boxes(html):
+    """Returns all product areas of the page."""
+    return BOX.select(make_soup(html, only=BOX_ONLY))
+
+
+def card_from_html(card_html):
+    return BOX.select_one(make_soup(card_html))
+
+
+def page_offers(html, cards=None):
+    """
+    Returns the offers of the page. With a CardCache only new or changed product boxes are parsed
+    and extracted, a page it finds no boxes in is parsed as a whole. Many boxes are extracted in the
+    extraction processes (see extraction.py).
+    """
+    if cards:
+        offers = cards.offers(html, CARD_START, "div", card_from_html, extract_lidl_card, parse_boxes)
+    else:
+        offers = extract_page(html, CARD_START, "div", card_from_html, extract_lidl_card)
+    return offers or list(parse_lidl_offers(html))
+
+
+def extract_lidl_card(item):
+    """Extracts the Offer of one product box."""
+    title_el = TITLE.select_one(item)
+    title = title_el.get_text(strip=True) if title_el else ""
+    footer_el = PRICE_FOOTER.select_one(item)
+    title += " " + footer_el.get_text(strip=True) if footer_el else ""
+    old_price_div = OLD_PRICE.select_one(item)
+    old_price = old_price_div.get_text(strip=True).replace(",", ".")[:-1] if old_price_div else ""
+    new_price_div = NEW_PRICE.select_one(item)
+    if new_price_div:
+        new_price = new_price_div.get_text(strip=True).replace(",", ".")[:-1]
+    else:
+        new_price = None
+    active_date_div = AVAILABILITY.select_one(item)
+    active_date_end = ""
+    active_date_start = ""
+    # Checking to see if there is an active date period (from-to) or just a from date
+    if active_date_div:
+        active_date = active_date_div.get_text(strip=True).split()
+        if len(active_date) > 3:
+            active_date_start = ".".join(active_date[:2])
+            active_date_end = ".".join(active_date[3:])
         else:
-            new_price = None
-        active_date_div = item.select_one(".product-grid-box__availabilities")
-        active_date_end = ""
-        active_date_start = ""
-        # Checking to see if there is an active date period (from-to) or just a from date
-        if active_date_div:
-            active_date = active_date_div.get_text(strip=True).split()
-            if len(active_date) > 3:
-                active_date_start = ".".join(active_date[:2])
-                active_date_end = ".".join(active_date[3:])
-            else:
-                active_date_start = ".".join(active_date[1:])
-
-        discount_el = item.select_one(".ods-price__box-content-wrapper")
-        discount = discount_el.get_text(strip=True) if discount_el else None
-        img_div = item.select_one(".odsc-image-gallery__item.odsc-image-gallery__item--active")
-        img = img_div.find("img")['src'] if img_div.find("img") else ""
-
-        # Saving all data to list in dictionary format
-        offers.append({
-            "shop": "lidl",
-            "title": title,
-            "price": new_price,
-            "old_price": old_price,
-            "discount": discount,
-            "date_start": active_date_start,
-            "date_end": active_date_end,
-            "additional_info": None,
-            "img": img,
-        })
-
-
-    driver.quit()
-    save_to_csv(offers)
\ No newline at end of file
+            active_date_start = ".".join(active_date[1:])
+
+    discount_el = DISCOUNT.select_one(item)
+    discount = discount_el.get_text(strip=True) if discount_el else None
+    img_div = ACTIVE_IMAGE.select_one(item)
+    img_el = img_div.find("img")
+    img = img_el['src'] if img_el else ""
+
+    return Offer.from_text("lidl", title, new_price, old_price, discount, active_date_start, active_date_end, None, img)
+
+
+def scrape_lidl_offers(url=None, save_csv=True, mode=None):
+    """
+    Scrapes all Lidl offers, optionally saving them to lidl_offers.csv.
+
+    :return: list of all offers found
+    """
+    offers = list(iter_lidl_offers(url, mode))
+    if save_csv:
+        save_offers_csv("lidl", offers)
+    return offers
+
+
+register_shop("lidl", scrape=scrape_lidl_offers, parse=page_offers, fetch=BROWSER, policy=expired_offers)
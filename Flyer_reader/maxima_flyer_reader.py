@@ -1,96 +1,152 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-import time
-from bs4 import BeautifulSoup
-import csv
-
-def save_to_csv(offers):
-    # Optionally write to CSV
-    with open("../Flyer_reader/maxima_offers.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["shop","title","price","old_price","discount","date_start","date_end","additional_info","img"])
-        writer.writeheader()
-        for o in offers:
-            writer.writerow(o)
-
-
-def scrape_maxima_offers(url="https://www.maxima.lt/pasiulymai"):
-    opts = Options()
-    opts.add_argument("--headless")  # runs Chrome in headless mode (no UI)
-    opts.add_argument("--no-sandbox")
-    opts.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(options=opts)
-    driver.get(url)
-
-    # Wait a bit for JS to load content — maybe 5 seconds; adjust if needed
-    time.sleep(1)
-
-    html = driver.page_source
-    soup = BeautifulSoup(html, "html.parser")
+from html_parsing import make_soup, compile_selector
+from card_cache import card_start, extract_page
+from page_waits import wait_for_stable_count
+from browser_pool import browser
+from structured_data import read_shop_offers
+from offer import Offer, save_csv as save_offers_csv
+from shop_registry import BROWSER, register_shop
+from freshness import expired_offers
+import metrics
+
+URL = "https://www.maxima.lt/pasiulymai"
+
+CARD_SELECTOR = "div.offer-card, div.offer-item, div.product-card"
+CARD = compile_selector(CARD_SELECTOR)
+# Start tag of an offer card in the raw page html, for fingerprinting cards without parsing the page
+CARD_START = card_start("div", "offer-card|offer-item|product-card")
+TITLE = compile_selector("h4, .mt-4 text-truncate text-truncate--2")
+OLD_PRICE = compile_selector(".price-old")
+OLD_PRICE_BOX = compile_selector("div.bg-white")
+NEW_PRICE_BOX = compile_selector("div.bg-primary")
+PRICE_EUR = compile_selector("div.price-eur")
+PRICE_CENTS = compile_selector("span.price-cents")
+DISCOUNT = compile_selector(".offer-discount")
+DATE_TO = compile_selector(".offer-dateTo-wrapper span")
+IMAGE_BOX = compile_selector(".offer-image")
+
+def render_page(url=URL):
+    """
+    Opens url in a pooled Chrome driver and waits until the offer cards are rendered.
+    The driver is handed back as soon as the page source is read.
+    """
+    with metrics.stage("maxima", "fetch"), browser() as driver:
+        driver.get(url)
+
+        # Wait for JS to render the offer cards and for their number to stop changing
+        wait_for_stable_count(driver, CARD_SELECTOR, settle=0.5, timeout=15)
+
+        html = driver.page_source
+
+    metrics.add("maxima", "html_bytes", len(html.encode()))
+    return html
+
+
+def iter_maxima_offers(url=URL, mode=None):
+    """
+    Generator version of the Maxima scraper, yields one Offer per offer card.
+    In "http" mode the page is fetched without a browser and read from its server rendered offer cards,
+    or its JSON-LD data when it has none, Chrome is used when that finds no offers (see read_shop_offers).
+
+    :param mode: "browser" or "http", defaults to SCRAPER_FETCH_MODE
+    """
+    yield from read_shop_offers("maxima", url, render_page, page_offers, mode)
+
+
+def parse_maxima_offers(html):
+    """Yields one Offer per offer card in the Maxima offers page html."""
+    for item in parse_cards(html):
+        yield extract_maxima_card(item)
+
+
+def parse_cards(html):
+    """Returns all offer cards of the page."""
+    soup = make_soup(html)
 
     # Example: find all product cards — you need to inspect the page to confirm the correct selector
     # For demonstration, let's pick something generic like all divs with a class that seems repeated
-    items = soup.select("div.offer-card, div.offer-item, div.product-card")  # adjust according to actual classes
+    return CARD.select(soup)
+
+
+def card_from_html(card_html):
+    return CARD.select_one(make_soup(card_html))
 
-    offers = []
-    for item in items:
-        title_el = item.select_one("h4, .mt-4 text-truncate text-truncate--2")
-        old_price_div = item.select_one('.price-old')
+
+def page_offers(html, cards=None):
+    """
+    Returns the offers of the page. With a CardCache only new or changed offer cards are parsed
+    and extracted, a page it finds no cards in is parsed as a whole. Many cards are extracted in the
+    extraction processes (see extraction.py).
+    """
+    if cards:
+        offers = cards.offers(html, CARD_START, "div", card_from_html, extract_maxima_card, parse_cards)
+    else:
+        offers = extract_page(html, CARD_START, "div", card_from_html, extract_maxima_card)
+    return offers or list(parse_maxima_offers(html))
+
+
+def extract_maxima_card(item):
+    """Extracts the Offer of one offer card."""
+    title_el = TITLE.select_one(item)
+    old_price_div = OLD_PRICE.select_one(item)
+    if old_price_div:
+        old_price = old_price_div.get_text(strip=True).replace(",", ".")[:-1]  # remove currency symbol
+    else:
+        old_price_div = OLD_PRICE_BOX.select_one(item)
         if old_price_div:
-            old_price = old_price_div.get_text(strip=True).replace(",", ".")[:-1]  # remove currency symbol
-        else:
-            old_price_div = item.select_one("div.bg-white")
-            if old_price_div:
-                euros = old_price_div.select_one("div.price-eur")
-                cents = old_price_div.select_one("span.price-cents")
-                old_price = ""
-                if euros:
-                    old_price += euros.get_text(strip=True)
-                if cents:
-                    old_price += "." + cents.get_text(strip=True)
-            else:
-                old_price = None
-
-        # New price (bg-primary)
-        new_price_div = item.select_one("div.bg-primary")
-        if new_price_div:
-            euros = new_price_div.select_one("div.price-eur")
-            cents = new_price_div.select_one("span.price-cents")
-            new_price = ""
+            euros = PRICE_EUR.select_one(old_price_div)
+            cents = PRICE_CENTS.select_one(old_price_div)
+            old_price = ""
             if euros:
-                new_price += euros.get_text(strip=True)
+                old_price += euros.get_text(strip=True)
             if cents:
-                new_price += "." + cents.get_text(strip=True)
+                old_price += "." + cents.get_text(strip=True)
         else:
-            new_price = None
+            old_price = None
 
-        discount_el = item.select_one(".offer-discount")
-        active_until_date_div = item.select_one(".offer-dateTo-wrapper span")
-        active_date_limiter_div = item.find(attrs={"data-bs-placement": "top"})
-        if active_date_limiter_div:
-            active_store_limiter = active_date_limiter_div.get("aria-label")
-        else:
-            active_store_limiter = ""
-
-        title = title_el.get_text(strip=True) if title_el else None
-        discount = discount_el.get_text(strip=True) if discount_el else None
-        active_until_date = active_until_date_div.get_text(strip=True).split()[-1] if active_until_date_div else None
-
-        img_div = item.select_one(".offer-image")
-        img = img_div.find("img")['src'] if img_div.find("img") else ""
-
-        offers.append({
-            "shop": "maxima",
-            "title": title,
-            "price": new_price,
-            "old_price": old_price,
-            "discount": discount,
-            "date_start": None,
-            "date_end": active_until_date,
-            "additional_info": active_store_limiter,
-            "img": img,
-        })
-
-
-    driver.quit()
-    save_to_csv(offers)
\ No newline at end of file
+    # New price (bg-primary)
+    new_price_div = NEW_PRICE_BOX.select_one(item)
+    if new_price_div:
+        euros = PRICE_EUR.select_one(new_price_div)
+        cents = PRICE_CENTS.select_one(new_price_div)
+        new_price = ""
+        if euros:
+            new_price += euros.get_text(strip=True)
+        if cents:
+            new_price += "." + cents.get_text(strip=True)
+    else:
+        new_price = None
+
+    discount_el = DISCOUNT.select_one(item)
+    active_until_date_div = DATE_TO.select_one(item)
+    active_date_limiter_div = item.find(attrs={"data-bs-placement": "top"})
+    if active_date_limiter_div:
+        active_store_limiter = active_date_limiter_div.get("aria-label")
+    else:
+        active_store_limiter = ""
+
+    title = title_el.get_text(strip=True) if title_el else None
+    discount = discount_el.get_text(strip=True) if discount_el else None
+    active_until_date = active_until_date_div.get_text(strip=True).split()[-1] if active_until_date_div else None
+
+    img_div = IMAGE_BOX.select_one(item)
+    img_el = img_div.find("img")
+    img = img_el['src'] if img_el else ""
+
+    return Offer.from_text(
+        "maxima", title, new_price, old_price, discount, None, active_until_date, active_store_limiter, img
+    )
+
+
+def scrape_maxima_offers(url=URL, save_csv=True, mode=None):
+    """
+    Scrapes all Maxima offers, optionally saving them to maxima_offers.csv.
+
+    :return: list of all offers found
+    """
+    offers = list(iter_maxima_offers(url, mode))
+    if save_csv:
+        save_offers_csv("maxima", offers)
+    return offers
+
+
+register_shop("maxima", scrape=scrape_maxima_offers, parse=page_offers, fetch=BROWSER, policy=expired_offers)
@@ -0,0 +1,199 @@
+import cProfile
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parent
+
+# JSON lines log of every run, one line per shop plus a run summary line
+METRICS_FILE = os.getenv("METRICS_FILE", str(MODULE_DIR / "metrics.jsonl"))
+# Optional Prometheus text exposition file (e.g. for node_exporter's textfile collector)
+PROM_FILE = os.getenv("METRICS_PROM_FILE")
+# Comma separated stage names run under cProfile ("all" for every stage), dumped to PROFILE_DIR
+PROFILE_STAGES = {s.strip() for s in os.getenv("PROFILE_STAGES", "").split(",") if s.strip()}
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", MODULE_DIR / "profiles"))
+
+
+class RunMetrics:
+    """
+    Collects per shop counters and stage timings of one scraper run. Safe to use from the scraper threads,
+    timings of a stage that runs in several threads at once (e.g. Rimi page fetches) are summed.
+
+    Stages listed in PROFILE_STAGES are also profiled, one cProfile.Profile per shop and stage
+    accumulates every call of the stage and is dumped to PROFILE_DIR/<run_id>.<shop>.<stage>.prof by emit.
+    """
+
+    def __init__(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.shops = defaultdict(lambda: defaultdict(float))
+        self.profiles = {}
+        self._active = set()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add(self, shop, key, value=1):
+        with self._lock:
+            self.shops[shop][key] += value
+
+    def set(self, shop, key, value):
+        with self._lock:
+            self.shops[shop][key] = value
+
+    def _start_profile(self, shop, name):
+        """Enables the stage's profiler, unless profiling is off for it or another one runs on this thread."""
+        if not (PROFILE_STAGES & {name, "all"}) or getattr(self._local, "profiling", False):
+            return None
+        key = (shop, name)
+        with self._lock:
+            if key in self._active:
+                return None
+            self._active.add(key)
+            profiler = self.profiles.setdefault(key, cProfile.Profile())
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows a single active profiler per interpreter
+            with self._lock:
+                self._active.discard(key)
+            return None
+        self._local.profiling = True
+        return key
+
+    def _stop_profile(self, key):
+        if key is None:
+            return
+        self.profiles[key].disable()
+        self._local.profiling = False
+        with self._lock:
+            self._active.discard(key)
+
+    @contextmanager
+    def stage(self, shop, name):
+        """Times the with block and adds it to <name>_seconds of the shop."""
+        profile = self._start_profile(shop, name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._stop_profile(profile)
+            self.add(shop, f"{name}_seconds", elapsed)
+
+    def timed_iter(self, shop, name, iterable, count_key=None):
+        """
+        Yields from iterable, adding only the time spent producing items to <name>_seconds,
+        so the consumer's work between items is not counted. The number of items goes to count_key.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        count = 0
+        try:
+            while True:
+                profile = self._start_profile(shop, name)
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                    self._stop_profile(profile)
+                count += 1
+                yield item
+        finally:
+            self.add(shop, f"{name}_seconds", elapsed)
+            if count_key:
+                self.add(shop, count_key, count)
+
+    def records(self):
+        """One dictionary per shop with its counters, timings and the derived cards_per_s."""
+        with self._lock:
+            shops = {shop: dict(values) for shop, values in self.shops.items()}
+        records = []
+        for shop, values in sorted(shops.items(), key=lambda item: str(item[0])):
+            if values.get("cards") and values.get("parse_seconds"):
+                values["cards_per_s"] = values["cards"] / values["parse_seconds"]
+            for key, value in values.items():
+                if isinstance(value, float):
+                    values[key] = int(value) if value.is_integer() else round(value, 4)
+            records.append({"run_id": self.run_id, "shop": shop, **values})
+        return records
+
+    def write_jsonl(self, path=METRICS_FILE):
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        records = self.records()
+        summary = {
+            "run_id": self.run_id,
+            "shop": None,
+            "run_seconds": round(time.time() - self.started, 3),
+            "shops": len(records),
+        }
+        with open(path, "a", encoding="utf-8") as f:
+            for record in records + [summary]:
+                f.write(json.dumps({"ts": ts, **record}, default=str) + "\n")
+
+    def write_prometheus(self, path=PROM_FILE):
+        """Writes every numeric shop value as flyer_scraper_<key>{shop="..."}, replacing the file atomically."""
+        by_key = defaultdict(list)
+        for record in self.records():
+            for key, value in record.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    by_key[key].append((record["shop"], value))
+
+        lines = []
+        for key, values in sorted(by_key.items()):
+            lines.append(f"# TYPE flyer_scraper_{key} gauge")
+            lines.extend(f'flyer_scraper_{key}{{shop="{shop}"}} {value}' for shop, value in values)
+        lines.append("# TYPE flyer_scraper_last_run_timestamp_seconds gauge")
+        lines.append(f"flyer_scraper_last_run_timestamp_seconds {int(time.time())}")
+
+        tmp = Path(f"{path}.tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+
+    def dump_profiles(self, directory=PROFILE_DIR):
+        if not self.profiles:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        for (shop, name), profiler in self.profiles.items():
+            profiler.dump_stats(directory / f"{self.run_id}.{shop}.{name}.prof")
+
+    def emit(self):
+        """Writes the run to METRICS_FILE and, when configured, METRICS_PROM_FILE and the stage profiles."""
+        self.write_jsonl()
+        if PROM_FILE:
+            self.write_prometheus()
+        self.dump_profiles()
+
+
+# Metrics of the run in progress, readers and the loader record into it through the helpers below
+current = RunMetrics()
+
+
+def new_run():
+    """Starts collecting a new run, returns its RunMetrics."""
+    global current
+    current = RunMetrics()
+    return current
+
+
+def stage(shop, name):
+    return current.stage(shop, name)
+
+
+def timed_iter(shop, name, iterable, count_key=None):
+    return current.timed_iter(shop, name, iterable, count_key)
+
+
+def add(shop, key, value=1):
+    current.add(shop, key, value)
+
+
+def set_value(shop, key, value):
+    current.set(shop, key, value)
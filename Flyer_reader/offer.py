@@ -0,0 +1,190 @@
+"""
+The Offer record every reader produces. Prices are integer cents and dates datetime.date objects,
+parsed once when the offer is scraped, so the loader, the card cache and the checkpoints pass typed
+values around instead of re-parsing strings. Offers are kept in __slots__, a refresh of tens of
+thousands of them takes a fraction of the memory the same offers take as dictionaries of strings.
+"""
+import csv
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+
+# Fields of an offer, in the column order of the <shop>_offers.csv files
+FIELDS = ("shop", "title", "price", "old_price", "discount", "date_start", "date_end",
+          "additional_info", "img", "price_unit")
+CSV_DIR = Path(__file__).resolve().parent
+
+
+# --------------------- Scraped text conversions ---------------------
+def convert_date(d, today=None):
+    """
+    :param today: date the year is picked relative to, defaults to the current date
+    """
+    if not d or d.strip() == "" or "." not in d:
+        return None
+
+    month, day = d.split(".")
+    if today is None:
+        today = datetime.now().date()
+    year = today.year
+
+    iso = f"{year}-{month}-{day}"
+    try:
+        parsed = datetime.strptime(iso, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+    if parsed < today and month != str(today.month):
+        parsed = parsed.replace(year=year + 1)
+
+    return parsed
+
+# A shop only has a handful of distinct "MM.DD" values and prices, so their conversions are memoised
+# (which also makes offers with the same date share one date object)
+@lru_cache(maxsize=4096)
+def cached_date(d, today):
+    return convert_date(d, today)
+
+def price_to_cents(s):
+    if "," in s:
+        s = s.replace(",", ".")
+    if not s or "." not in s:
+        return None
+    euros, cents = s.split(".")
+    # "2.5" is 2.50, prices written from floats drop the trailing zero
+    return int(euros) * 100 + int(cents.ljust(2, "0"))
+
+cached_cents = lru_cache(maxsize=4096)(price_to_cents)
+
+def _intern(text):
+    # Discount labels and store limiters repeat across most cards of a shop
+    return sys.intern(text) if text else text
+
+
+def _cents(value):
+    """Cents of a stored price: an int, or scraped text ("2.99", "2,99") from older files."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return round(value * 100)
+    if "." in value or "," in value:
+        return cached_cents(value)
+    return int(value)
+
+
+def _date(value, today=None):
+    """Date of a stored date: a date, an ISO "YYYY-MM-DD" string, or scraped "MM.DD" text from older files."""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    if "-" in value:
+        return date.fromisoformat(value)
+    return cached_date(value, today or date.today())
+
+
+# --------------------- Offer ---------------------
+class Offer:
+    """One scraped offer, see the module docstring. Text fields missing on the card are None or ""."""
+
+    __slots__ = FIELDS
+
+    def __init__(self, shop, title=None, price=None, old_price=None, discount=None, date_start=None,
+                 date_end=None, additional_info=None, img=None, price_unit=None):
+        self.shop = shop
+        self.title = title
+        self.price = price
+        self.old_price = old_price
+        self.discount = discount
+        self.date_start = date_start
+        self.date_end = date_end
+        self.additional_info = additional_info
+        self.img = img
+        self.price_unit = price_unit
+
+    @classmethod
+    def from_text(cls, shop, title, price, old_price, discount, date_start, date_end, additional_info, img,
+                  price_unit=None, today=None):
+        """
+        Offer from the text a reader scraped off a card.
+
+        :param price, old_price: "2.99" / "2,99" price text, None or "" when missing
+        :param date_start, date_end: "MM.DD" text, the year is picked relative to today (see convert_date)
+        :param today: defaults to the current date
+        """
+        today = today or date.today()
+        return cls(
+            shop,
+            title,
+            cached_cents(price) if price else None,
+            cached_cents(old_price) if old_price else None,
+            _intern(discount),
+            cached_date(date_start, today) if date_start else None,
+            cached_date(date_end, today) if date_end else None,
+            _intern(additional_info),
+            img,
+            _intern(price_unit),
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Offer from to_dict() output or a <shop>_offers.csv row, including rows of the older text format."""
+        return cls(
+            data["shop"],
+            data.get("title"),
+            _cents(data.get("price")),
+            _cents(data.get("old_price")),
+            data.get("discount"),
+            _date(data.get("date_start")),
+            _date(data.get("date_end")),
+            data.get("additional_info"),
+            data.get("img"),
+            data.get("price_unit") or None,
+        )
+
+    def to_dict(self):
+        """JSON ready dictionary of the offer, dates as ISO strings."""
+        data = {field: getattr(self, field) for field in FIELDS}
+        for field in ("date_start", "date_end"):
+            if data[field] is not None:
+                data[field] = data[field].isoformat()
+        return data
+
+    def copy(self):
+        return Offer(*(getattr(self, field) for field in FIELDS))
+
+    def __reduce__(self):
+        # Pickled as the bare field values, offers come back from the extraction processes (see extraction.py)
+        return Offer, tuple(getattr(self, field) for field in FIELDS)
+
+    def __eq__(self, other):
+        if not isinstance(other, Offer):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in FIELDS)
+
+    def __repr__(self):
+        return f"Offer({self.shop!r}, {self.title!r}, price={self.price!r})"
+
+
+# --------------------- CSV files ---------------------
+def csv_path(shop):
+    return CSV_DIR / f"{shop}_offers.csv"
+
+
+def save_csv(shop, offers):
+    """Writes the offers to <shop>_offers.csv next to this file."""
+    with open(csv_path(shop), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for o in offers:
+            writer.writerow(o.to_dict())
+
+
+def read_csv(shop):
+    """Yields the offers saved in <shop>_offers.csv."""
+    with open(csv_path(shop), "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield Offer.from_dict(row)
@@ -0,0 +1,100 @@
+import time
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+# How often conditions are re-checked while waiting (seconds)
+POLL = 0.1
+
+SCROLL_TO_BOTTOM = "window.scrollTo(0, document.body.scrollHeight);"
+# Scroll position and whether the bottom of the page is reached
+SCROLL_STATE = "return [window.scrollY, window.innerHeight + window.scrollY >= document.body.scrollHeight - 2];"
+
+
+def count_elements(driver, selector):
+    # Counting in the page is one round trip, find_elements would create a WebElement per card
+    return driver.execute_script("return document.querySelectorAll(arguments[0]).length;", selector)
+
+
+def wait_for_more(driver, selector, previous, timeout):
+    """
+    Waits until more than previous elements match selector.
+
+    :return: the new count, or previous if nothing new appeared within timeout
+    """
+    def grown(d):
+        count = count_elements(d, selector)
+        return count if count > previous else False
+
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=POLL).until(grown)
+    except TimeoutException:
+        return previous
+
+
+def wait_for_stable_count(driver, selector, settle=0.5, timeout=10):
+    """
+    Waits until at least one element matches selector and the number of matches
+    has not changed for settle seconds, so a half rendered list is not read.
+
+    :return: number of matching elements (whatever was there when timeout ran out)
+    """
+    state = {"count": -1, "since": time.monotonic()}
+
+    def settled(d):
+        count = count_elements(d, selector)
+        now = time.monotonic()
+        if count != state["count"]:
+            state["count"], state["since"] = count, now
+            return False
+        return count if count > 0 and now - state["since"] >= settle else False
+
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=POLL).until(settled)
+    except TimeoutException:
+        return count_elements(driver, selector)
+
+
+def scroll_until_loaded(driver, selector, scroll_script=SCROLL_TO_BOTTOM,
+                        min_timeout=0.3, max_timeout=6, max_idle_rounds=2, max_seconds=180, max_rounds=1000):
+    """
+    Scrolls a lazy loading page until no more elements matching selector appear.
+    After each scroll it returns to scrolling as soon as new elements show up. While the bottom
+    of the page isn't reached it waits at most min_timeout, at the bottom it waits an adaptive timeout
+    (3x the slowest load seen so far, between min_timeout and max_timeout) before counting the round as idle.
+    A round without new elements is idle wherever the page is, unless the scroll still moved it down, so a
+    page that stops scrolling short of its bottom ends the loop too.
+
+    :param selector: CSS selector of the cards being loaded
+    :param scroll_script: JS run for each scroll step
+    :param max_idle_rounds: scrolls without new elements, at the bottom or not moving the page, before stopping
+    :param max_seconds, max_rounds: stop scrolling after this long or this many scrolls whatever the page does
+    :return: final number of matching elements
+    """
+    deadline = time.monotonic() + max_seconds
+    count = wait_for_stable_count(driver, selector, timeout=max_timeout)
+    timeout = max_timeout
+    slowest = 0
+    idle_rounds = 0
+    position = None
+    rounds = 0
+
+    while idle_rounds < max_idle_rounds:
+        if rounds >= max_rounds or time.monotonic() >= deadline:
+            print(f"Stopped scrolling after {rounds} scrolls with {count} elements loaded.")
+            break
+        rounds += 1
+        driver.execute_script(scroll_script)
+        previous, (position, at_bottom) = position, driver.execute_script(SCROLL_STATE)
+
+        started = time.monotonic()
+        new_count = wait_for_more(driver, selector, count, timeout if at_bottom else min_timeout)
+
+        if new_count > count:
+            slowest = max(slowest, time.monotonic() - started)
+            timeout = min(max_timeout, max(min_timeout, slowest * 3))
+            count = new_count
+            idle_rounds = 0
+        elif at_bottom or position == previous:
+            idle_rounds += 1
+
+    return count
@@ -0,0 +1,225 @@
+"""
+Price history of every offer. Each load appends the loaded offers to offer_price_history, a table
+partitioned by month of the scrape date with a BRIN index on that date, so main_offers only ever holds
+the current offers. Months older than HISTORY_RETENTION_MONTHS are compacted into one row per product
+and month (offer_price_history_monthly) and their partitions dropped.
+
+Lookups take a date range, so PostgreSQL only scans the partitions of the months asked for.
+"""
+import os
+from datetime import date, timedelta
+
+HISTORY_TABLE = "offer_price_history"
+MONTHLY_TABLE = "offer_price_history_monthly"
+# Months of daily prices kept, older months only keep their monthly min / max / average
+RETENTION_MONTHS = int(os.getenv("HISTORY_RETENTION_MONTHS", "24"))
+
+
+# --------------------- Schema and partitions ---------------------
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{HISTORY_TABLE}_{month:%Y_%m}"
+
+
+def ensure_history_schema(cur, conn):
+    """Creates the partitioned history table, its indexes and the monthly summary table if missing."""
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            shop text NOT NULL,
+            title_normalized text,
+            price integer,
+            old_price integer,
+            unit text,
+            unit_price integer,
+            discount_percent smallint,
+            occurrence smallint NOT NULL DEFAULT 0,
+            scraped_on date NOT NULL
+        ) PARTITION BY RANGE (scraped_on);
+        """
+    )
+    # Tables made before offers were told apart by occurrence had one row per title, shop and day. Looked up
+    # first, ALTER TABLE locks the table even when the column exists
+    cur.execute(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = 'occurrence';
+        """,
+        (HISTORY_TABLE,)
+    )
+    if cur.fetchone() is None:
+        cur.execute(f"ALTER TABLE {HISTORY_TABLE} ADD COLUMN IF NOT EXISTS occurrence smallint NOT NULL DEFAULT 0;")
+        cur.execute(f"DROP INDEX IF EXISTS {HISTORY_TABLE}_product_day_idx;")
+    # One row per offer and day, later runs of the same day keep the first one. Rows without a
+    # title_normalized are never equal in a unique index, so those are appended again by every run
+    cur.execute(
+        f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS {HISTORY_TABLE}_offer_day_idx
+        ON {HISTORY_TABLE} (title_normalized, shop, occurrence, scraped_on);
+        """
+    )
+    # Rows are appended in date order, so a BRIN index stays a few pages per partition
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {HISTORY_TABLE}_scraped_on_brin ON {HISTORY_TABLE} USING brin (scraped_on);")
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {MONTHLY_TABLE} (
+            shop text NOT NULL,
+            title_normalized text,
+            month date NOT NULL,
+            min_price integer,
+            max_price integer,
+            avg_price integer,
+            days integer NOT NULL,
+            UNIQUE (title_normalized, shop, month)
+        );
+        """
+    )
+    conn.commit()
+
+
+def ensure_partition(cur, day):
+    """Creates the partition of day's month if missing, in the caller's transaction."""
+    start = month_start(day)
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {HISTORY_TABLE}
+        FOR VALUES FROM (%s) TO (%s);
+        """,
+        (start, add_months(start, 1))
+    )
+
+
+def append_from_staging(cur, day=None):
+    """
+    Appends the offers in offers_staging to the history as scraped on day (default today),
+    in the caller's transaction so the history and main_offers are committed together.
+    Offers of a shop with the same title (e.g. two sizes sold at different prices) are told apart by their
+    occurrence in scraped order, like the offer_key of incremental syncs, so each keeps its price. Offers
+    without a title_normalized are not deduplicated, see ensure_history_schema.
+
+    :return: rows appended
+    """
+    day = day or date.today()
+    ensure_partition(cur, day)
+    cur.execute(
+        f"""
+        INSERT INTO {HISTORY_TABLE}
+            (shop, title_normalized, price, old_price, unit, unit_price, discount_percent, occurrence, scraped_on)
+        SELECT shop, title_normalized, price, old_price, unit, unit_price, discount_percent,
+            ROW_NUMBER() OVER (PARTITION BY shop, title_normalized ORDER BY ord) - 1, %s
+        FROM offers_staging
+        ORDER BY ord
+        ON CONFLICT DO NOTHING;
+        """,
+        (day,)
+    )
+    return cur.rowcount
+
+
+# --------------------- Retention ---------------------
+def history_partitions(cur):
+    """:return: list of (partition name, month) of the history table, oldest first"""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s;
+        """,
+        (HISTORY_TABLE,)
+    )
+    partitions = []
+    prefix = HISTORY_TABLE + "_"
+    for (name,) in cur.fetchall():
+        try:
+            year, month = name[len(prefix):].split("_")
+            partitions.append((name, date(int(year), int(month), 1)))
+        except ValueError:
+            continue  # not made by ensure_partition
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def apply_retention(cur, conn, months=RETENTION_MONTHS, today=None):
+    """
+    Compacts every partition of a month that ended more than months ago into MONTHLY_TABLE, then detaches
+    and drops it. Each partition is handled in its own transaction.
+
+    :return: names of the dropped partitions
+    """
+    cutoff = add_months(month_start(today or date.today()), -months)
+    dropped = []
+    for name, month in history_partitions(cur):
+        if month >= cutoff:
+            break
+        try:
+            cur.execute(
+                f"""
+                INSERT INTO {MONTHLY_TABLE} (shop, title_normalized, month, min_price, max_price, avg_price, days)
+                SELECT shop, title_normalized, %s, MIN(price), MAX(price), ROUND(AVG(price))::integer, COUNT(*)
+                FROM {name}
+                GROUP BY shop, title_normalized
+                ON CONFLICT (title_normalized, shop, month) DO NOTHING;
+                """,
+                (month,)
+            )
+            cur.execute(f"ALTER TABLE {HISTORY_TABLE} DETACH PARTITION {name};")
+            cur.execute(f"DROP TABLE {name};")
+            conn.commit()
+            dropped.append(name)
+        except Exception as e:
+            conn.rollback()
+            print(f"Could not compact history partition {name}:", e)
+    return dropped
+
+
+# --------------------- Queries ---------------------
+def price_trend(cur, title_normalized, weeks=12, shop=None, today=None):
+    """
+    Daily prices of a product over the last weeks, from the partitions of those weeks only.
+
+    :param title_normalized: the product's normalised title (main_offers.title_normalized)
+    :param shop: only this shop's prices, all shops if None
+    :return: list of (scraped_on, shop, price, old_price, unit_price) oldest first
+    """
+    since = (today or date.today()) - timedelta(weeks=weeks)
+    cur.execute(
+        f"""
+        SELECT scraped_on, shop, price, old_price, unit_price
+        FROM {HISTORY_TABLE}
+        WHERE title_normalized = %s AND scraped_on >= %s
+        {"AND shop = %s" if shop else ""}
+        ORDER BY scraped_on, shop, occurrence;
+        """,
+        (title_normalized, since, shop) if shop else (title_normalized, since)
+    )
+    return cur.fetchall()
+
+
+def lowest_price(cur, title_normalized, weeks=4, shop=None, today=None):
+    """
+    Lowest price of a product in the last weeks, e.g. to tell whether today's offer really is a low.
+
+    :return: (price, scraped_on, shop) of the lowest price (its earliest day), or None if never seen
+    """
+    since = (today or date.today()) - timedelta(weeks=weeks)
+    cur.execute(
+        f"""
+        SELECT price, scraped_on, shop
+        FROM {HISTORY_TABLE}
+        WHERE title_normalized = %s AND scraped_on >= %s AND price IS NOT NULL
+        {"AND shop = %s" if shop else ""}
+        ORDER BY price, scraped_on
+        LIMIT 1;
+        """,
+        (title_normalized, since, shop) if shop else (title_normalized, since)
+    )
+    return cur.fetchone()
@@ -0,0 +1,40 @@
+"""
+Process pool shared by the scraper threads for CPU work (card extraction, image thumbnails).
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+class SpawnedPool:
+    """
+    ProcessPoolExecutor started on first use. Spawned, not forked: the scraper process runs threads
+    (and Chrome drivers) that a fork would copy. A crashed worker breaks the whole pool, the owner calls
+    discard() and the next get() starts a new one.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def discard(self):
+        """Drops a broken pool without waiting for its work."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
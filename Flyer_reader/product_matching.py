@@ -0,0 +1,173 @@
+"""
+Groups equivalent offers of different shops into products, e.g. the same milk at Maxima, Lidl and IKI.
+
+Offers are compared by their search_tokens (stemmed words of the normalised title, see search_tokens.py),
+weighted by how rare each token is, plus their size. Only offers that share a rare token are compared
+(token blocking), so the work grows with the number of offers rather than with its square. Every offer is
+linked to its most similar offer of each other shop when that offer picks it back, and linked offers form
+a group. Groups are rewritten to product_groups after every run that loaded offers.
+"""
+import io
+import heapq
+import math
+import os
+from collections import Counter, defaultdict
+from search_tokens import search_tokens
+
+# Tokens found in more offers than this are too common to block on ("suris", "pienas" still are not)
+MAX_BLOCK = int(os.getenv("MATCH_MAX_BLOCK", "300"))
+# Similarity a link needs, 0..1
+MIN_SCORE = float(os.getenv("MATCH_MIN_SCORE", "0.45"))
+# Blocking candidates per other shop whose exact similarity is computed
+CANDIDATES = 5
+# Quantities within this ratio count as the same size, other sizes lower the similarity by SIZE_PENALTY
+SIZE_TOLERANCE = 1.15
+SIZE_PENALTY = 0.8
+
+
+def ensure_group_schema(cur, conn):
+    """Creates product_groups: one row per grouped offer, with its group and the score of its link."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS product_groups (
+            offer_id integer PRIMARY KEY REFERENCES main_offers (id) ON DELETE CASCADE,
+            group_id integer NOT NULL,
+            shops smallint NOT NULL,
+            score real NOT NULL
+        );
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS product_groups_group_id_idx ON product_groups (group_id);")
+    conn.commit()
+
+
+class _Offer:
+    __slots__ = ("id", "shop", "tokens", "unit", "quantity", "weight")
+
+    def __init__(self, id, shop, tokens, unit, quantity):
+        self.id = id
+        self.shop = shop
+        self.tokens = tokens
+        self.unit = unit
+        self.quantity = quantity
+        self.weight = 0.0
+
+
+def similarity(a, b, weights):
+    """
+    Weighted Jaccard similarity of two offers' tokens, lowered when their sizes differ.
+
+    :return: 0..1, 0 for offers measured in different units (kg vs l)
+    """
+    if a.unit and b.unit and a.unit != b.unit:
+        return 0.0
+    shared = sum(weights[t] for t in a.tokens & b.tokens)
+    score = shared / (a.weight + b.weight - shared) if shared else 0.0
+    if a.quantity and b.quantity and max(a.quantity, b.quantity) > SIZE_TOLERANCE * min(a.quantity, b.quantity):
+        score *= SIZE_PENALTY
+    return score
+
+
+def match_offers(offers):
+    """
+    Clusters offers of different shops into product groups.
+
+    :param offers: iterable of (id, shop, search_tokens, unit, quantity)
+    :return: dictionary of offer id -> (group_id, shops in the group, score of the offer's best link),
+             only for offers whose group spans at least two shops. group_id is the group's smallest offer id.
+    """
+    offers = [_Offer(id, shop, frozenset(tokens.split()), unit, float(quantity) if quantity else None)
+              for id, shop, tokens, unit, quantity in offers]
+    offers = [o for o in offers if o.tokens]
+    if not offers:
+        return {}
+
+    # Rarer tokens say more about the product: inverse document frequency weights
+    frequency = Counter(t for o in offers for t in o.tokens)
+    weights = {t: math.log(len(offers) / n) + 1 for t, n in frequency.items()}
+    # blocks[token][shop]: the offers of a shop with the token, for the tokens rare enough to block on
+    blocks = defaultdict(lambda: defaultdict(list))
+    for i, o in enumerate(offers):
+        o.weight = sum(weights[t] for t in o.tokens)
+        for t in o.tokens:
+            if 1 < frequency[t] <= MAX_BLOCK:
+                blocks[t][o.shop].append(i)
+    shops = {o.shop for o in offers}
+
+    # best[i][shop] = (score, j): the most similar offer of each other shop
+    best = [dict() for _ in offers]
+    for i, o in enumerate(offers):
+        tokens = [(weights[t], blocks[t]) for t in o.tokens if t in blocks]
+        for shop in shops:
+            if shop == o.shop:
+                continue
+            # Blocking score: weight of the rare tokens shared with each candidate of the shop
+            shared = defaultdict(float)
+            for w, block in tokens:
+                for j in block.get(shop, ()):
+                    shared[j] += w
+            if not shared:
+                continue
+            candidates = heapq.nlargest(CANDIDATES, shared, key=shared.__getitem__)
+            score, j = max((similarity(o, offers[j], weights), -j) for j in candidates)
+            if score >= MIN_SCORE:
+                best[i][shop] = (score, -j)
+
+    # Links where both offers picked each other, merged with union-find
+    parent = list(range(len(offers)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    link_score = [0.0] * len(offers)
+    for i, o in enumerate(offers):
+        for score, j in best[i].values():
+            if i < j and best[j].get(o.shop, (0, None))[1] == i:
+                parent[find(i)] = find(j)
+                link_score[i] = max(link_score[i], score)
+                link_score[j] = max(link_score[j], score)
+
+    members = defaultdict(list)
+    for i in range(len(offers)):
+        members[find(i)].append(i)
+    groups = {}
+    for group in members.values():
+        group_shops = len({offers[i].shop for i in group})
+        if group_shops < 2:
+            continue
+        group_id = min(offers[i].id for i in group)
+        for i in group:
+            groups[offers[i].id] = (group_id, group_shops, round(link_score[i], 4))
+    return groups
+
+
+def fetch_offers(cur):
+    cur.execute("SELECT id, shop, search_tokens, title_normalized, unit, quantity FROM main_offers;")
+    for id, shop, tokens, title_normalized, unit, quantity in cur.fetchall():
+        # Rows loaded before search_tokens existed get theirs here
+        yield id, shop, tokens if tokens is not None else search_tokens(title_normalized), unit, quantity
+
+
+def update_product_groups(cur, conn):
+    """
+    Recomputes the product groups of every offer in main_offers and replaces product_groups with them
+    in one transaction.
+
+    :return: number of groups
+    """
+    groups = match_offers(fetch_offers(cur))
+    buf = io.StringIO()
+    for offer_id, (group_id, shops, score) in groups.items():
+        buf.write(f"{offer_id}\t{group_id}\t{shops}\t{score}\n")
+    buf.seek(0)
+    try:
+        cur.execute("DELETE FROM product_groups;")
+        cur.copy_expert("COPY product_groups (offer_id, group_id, shops, score) FROM STDIN", buf)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len({group_id for group_id, _, _ in groups.values()})
@@ -1,7 +1,13 @@
-import requests
-from bs4 import BeautifulSoup
-import csv
-import time
+from concurrent.futures import ThreadPoolExecutor
+from http_session import make_session, record_response, REQUEST_TIMEOUT
+from http_cache import get_cache, ShopUnchanged, SKIP_UNCHANGED
+from html_parsing import make_soup, strainer, compile_selector
+from card_cache import card_cache, card_start, extract_page
+from checkpoints import page_checkpoint
+from offer import Offer, save_csv as save_offers_csv
+from shop_registry import HTTP, register_shop
+from freshness import scraped_before_today
+import metrics
 
 # Define headers to mimic a real browser visit in order to avoid bot/scraper blocks
 HEADERS = {
@@ -10,23 +16,63 @@ HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
 }
 
+# Number of pages requested at the same time
+PAGE_WINDOW = 4
 
+# Only the product grid is built into the parse tree, selectors are compiled once and scoped to each card
+GRID_ONLY = strainer("ul", class_="product-grid")
+GRID = compile_selector("ul.product-grid")
+GRID_ITEM = compile_selector("li.product-grid__item")
+TITLE = compile_selector(".card__details > .card__name")
+LABEL_PRICE = compile_selector(".card__image-wrapper .price-label  .price-label__body  .price-label__price")
+CARD_PRICE = compile_selector(".card__details > .card__details-inner  .card__price-wrapper  .price-tag.card__price")
+OLD_PRICE = compile_selector(".card__details > .card__details-inner  .card__price-wrapper  .old-price-tag span")
+IMAGE = compile_selector(".card__image-wrapper  img")
+DISCOUNT = compile_selector(".price-label__header.-red")
+# Start tag of a card in the raw page html, for fingerprinting cards without parsing the page
+CARD_START = card_start("li", "product-grid__item")
+
+
+def page_url(page_num):
+    return f"https://www.rimi.lt/e-parduotuve/lt/akcijos?currentPage={page_num}&pageSize=80"
 
 # Function to get HTML content of a specific page number
-def get_page_html(page_num):
-    url = f"https://www.rimi.lt/e-parduotuve/lt/akcijos?currentPage={page_num}&pageSize=80"
-    r = requests.get(url, headers=HEADERS)
+def get_page_html(page_num, session=None):
+    if session is None:
+        session = make_session(headers=HEADERS)
+    with metrics.stage("rimi", "fetch"):
+        r = session.get(page_url(page_num), timeout=REQUEST_TIMEOUT)
     # Checking to see if the request was a success, otherwise raise an error
     if r.status_code != 200:
         raise Exception(f"Failed to fetch page {page_num}, status code: {r.status_code}") 
+    record_response("rimi", r)
     return r.text
 
 # Function to extract the items from the item grid if it exists.
-def get_items_from_html(page_num):
-    html = get_page_html(page_num)
-    soup = BeautifulSoup(html, "html.parser")
-    cards_grid = soup.select_one("ul.product-grid")
-    return cards_grid.select("li.product-grid__item") if cards_grid else []
+def get_items_from_html(page_num, session=None):
+    return parse_items(get_page_html(page_num, session))
+
+def parse_items(html):
+    soup = make_soup(html, only=GRID_ONLY)
+    cards_grid = GRID.select_one(soup)
+    return GRID_ITEM.select(cards_grid) if cards_grid else []
+
+def card_from_html(card_html):
+    return GRID_ITEM.select_one(make_soup(card_html))
+
+def page_offers(html, cards=None):
+    """
+    Returns the offers of one page. With a CardCache only new or changed cards are parsed and extracted,
+    a page it finds no cards in is parsed as a whole. A page's cards are extracted in the extraction
+    processes (see extraction.py), so the pages of a window use every core.
+
+    :param cards: CardCache of the run, or None to extract every card
+    """
+    if cards:
+        offers = cards.offers(html, CARD_START, "li", card_from_html, extract_item_data, parse_items)
+    else:
+        offers = extract_page(html, CARD_START, "li", card_from_html, extract_item_data)
+    return offers or [extract_item_data(item) for item in parse_items(html)]
 
 def format_price(price_str):
     """
@@ -48,78 +94,129 @@ def format_price(price_str):
     else:
         return (price_str[:-6] + "." + price_str[-6:-4])
 
+def price_unit(price_str):
+    """
+    :param price_str: price entry from item description
+    :return: unit the price is per, e.g. "kg" for "2,69€/kg", or None for a plain "2,69€"
+    """
+    _, slash, unit = price_str.partition("/")
+    return unit.strip(" .").lower() or None if slash else None
+
 def extract_item_data(item):
     """
     Takes the param item and extracts relevant data from it based on the HTML structure
-    and returns a dictionary with the extracted data.
+    and returns an Offer with the extracted data.
 
     :param item: takes the item html to extract data from
-    :return: dictionary with extracted data
+    :return: Offer with extracted data
     """
     # Title
-    title_div = item.select_one(".card__details > .card__name")
+    title_div = TITLE.select_one(item)
     title = title_div.get_text(strip=True) if title_div else ""
 
     # Price and Old Price
-    price_div = item.select_one(".card__image-wrapper .price-label  .price-label__body  .price-label__price")
+    price_div = LABEL_PRICE.select_one(item)
+    card_price_div = CARD_PRICE.select_one(item)
     if price_div:
         price = format_price(price_div.get_text(strip=True))
-        old_price_div = item.select_one(".card__details > .card__details-inner  .card__price-wrapper  .price-tag.card__price")
-        old_price = format_price(old_price_div.get_text(strip=True)) if old_price_div else ""
+        old_price = format_price(card_price_div.get_text(strip=True)) if card_price_div else ""
     else:
-        price_div = item.select_one(".card__details > .card__details-inner  .card__price-wrapper  .price-tag.card__price")
-        price = format_price(price_div.get_text(strip=True)) if price_div else ""
-        old_price_div = item.select_one(".card__details > .card__details-inner  .card__price-wrapper  .old-price-tag span")
+        price = format_price(card_price_div.get_text(strip=True)) if card_price_div else ""
+        old_price_div = OLD_PRICE.select_one(item)
         old_price = format_price(old_price_div.get_text(strip=True)) if old_price_div else ""
 
+    # Unit of the prices, the card price tag shows it for goods sold by weight ("€/kg")
+    unit = price_unit(card_price_div.get_text(strip=True)) if card_price_div else None
+
     # Image
-    img_div = item.select_one(".card__image-wrapper  img")
+    img_div = IMAGE.select_one(item)
     img = img_div['data-src'] if img_div else ""
 
-    discount_div = item.select_one(".price-label__header.-red")
+    discount_div = DISCOUNT.select_one(item)
     discount = discount_div.get_text(strip=True) if discount_div else None
 
-    return {
-        "shop": "rimi",
-        "title": title,
-        "price": price,
-        "old_price": old_price,
-        "discount": discount,
-        "date_start": None,
-        "date_end": None,
-        "additional_info": None,
-        "img": img,
-        }
-
-
-# Saves the param offers (list of dictionaries) to a CSV file.
-def save_to_csv(offers, filename="rimi_offers.csv"):
-    with open(f"../Flyer_reader/{filename}", "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["shop","title", "price", "old_price","discount","date_start","date_end","additional_info","img"])
-        writer.writeheader()
-        for offer in offers:
-            writer.writerow(offer)
-
-def scrape_rimi_offers():
+    return Offer.from_text("rimi", title, price, old_price, discount, None, None, None, img, price_unit=unit)
+
+def iter_rimi_offers(window=PAGE_WINDOW):
     """
-    Scrapes all Rimi offers by iterating through pages until no more items are found using a While loop.
-    On each loop, checks to see if offers were found, to identify the last page of offers, and breaks the loop if none are found.
-    calls the extract_item_data function to extract relevant data from each item found and saves it to offers list.
-    Increments page variable after each page scraped. Returns all offers once done.
+    Yields all Rimi offers by fetching pages in windows of concurrent requests over one pooled session.
+    Pages of a window are processed in order, and the first page without items marks the end of the offers,
+    so at most window - 1 requests are made past the last page.
+    calls the extract_item_data function to extract relevant data from each item found and yields it.
 
-    :return: list of all offers found
+    With SKIP_UNCHANGED_SHOPS=1, raises ShopUnchanged when the first page is byte-identical
+    to the cached one from the previous run. Cards unchanged since the previous run are not
+    re-extracted (see card_cache), unless CARD_CACHE=0.
+
+    Every parsed page is checkpointed (see checkpoints.py), so after a failed page the retry
+    only fetches the pages that were not scraped yet.
+
+    :param window: number of pages fetched at the same time
     """
     page = 1
-    offers = []
-
-    while True:
-        print("Scraping page:", page)
-        items = get_items_from_html(page)
-        if not items:
-            break
-        for item in items:
-            offers.append(extract_item_data(item))
-        page += 1
-        # time.sleep(1)
-
-    save_to_csv(offers)
+    session = make_session(headers=HEADERS, pool_size=window)
+    first_page = None
+
+    checkpoint = page_checkpoint("rimi")
+    # A failed run has already cached the first page, so it can't tell whether the offers changed
+    resuming = bool(checkpoint and checkpoint.pages)
+
+    cache = get_cache()
+    if SKIP_UNCHANGED and cache and not resuming:
+        previous = cache.digest(page_url(1))
+        first_page = get_page_html(1, session)
+        if previous is not None and cache.digest(page_url(1)) == previous:
+            session.close()
+            raise ShopUnchanged("Rimi offers unchanged since the last run")
+
+    cards = card_cache("rimi")
+
+    def fetch(page_num):
+        saved = checkpoint.get(page_num) if checkpoint else None
+        if saved is not None:
+            metrics.add("rimi", "pages_resumed")
+            return saved
+        if page_num == 1 and first_page is not None:
+            html = first_page
+        else:
+            html = get_page_html(page_num, session)
+        with metrics.stage("rimi", "parse"):
+            offers = page_offers(html, cards)
+        if checkpoint and offers:
+            checkpoint.save(page_num, offers)
+        return offers
+
+    with session, ThreadPoolExecutor(max_workers=window) as pool:
+        reached_end = False
+        while not reached_end:
+            pages = range(page, page + window)
+            results = pool.map(fetch, pages)
+
+            for page_num, offers in zip(pages, results):
+                if not offers:
+                    reached_end = True
+                    break
+                print("Scraping page:", page_num)
+                metrics.add("rimi", "cards", len(offers))
+                yield from offers
+            page += window
+
+    if cards:
+        cards.save()
+    if checkpoint:
+        checkpoint.done()
+
+
+def scrape_rimi_offers(window=PAGE_WINDOW, save_csv=True):
+    """
+    Scrapes all Rimi offers, optionally saving them to rimi_offers.csv.
+
+    :return: list of all offers found
+    """
+    offers = list(iter_rimi_offers(window))
+    if save_csv:
+        save_offers_csv("rimi", offers)
+    return offers
+
+
+register_shop("rimi", scrape=scrape_rimi_offers, parse=page_offers, fetch=HTTP, policy=scraped_before_today)
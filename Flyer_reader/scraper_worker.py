@@ -0,0 +1,249 @@
+"""
+Long running scraper worker. Imports, the DB connection, the Chrome pool and the HTTP cache are set up
+once, then every shop's offers are checked by the freshness planner on its own interval and re-scraped
+when stale. A small JSON endpoint on localhost lets the backend inspect runs or trigger one:
+
+    GET  /status   current run, queued requests, next check per shop and the last runs with their metrics
+    POST /run      {"shops": ["rimi"], "force": true}, both optional; queues a run (or answers the same one
+                   still queued), answers 202
+    POST /basket   {"items": ["pienas", "duona"], "max_shops": 2}; cheapest shops for a grocery list, see basket.py
+
+    python scraper_worker.py
+"""
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import psycopg2
+import csv_to_sql
+import metrics
+from basket import CandidateIndex, optimise_basket
+from browser_pool import get_pool
+from image_mirror import close_mirror
+from extraction import close_extractor
+
+HOST = "127.0.0.1"
+PORT = int(os.getenv("SCRAPER_WORKER_PORT", "8765"))
+# Seconds between freshness checks of a shop, SCRAPER_CHECK_INTERVAL_<SHOP> overrides it for one shop
+CHECK_INTERVAL = int(os.getenv("SCRAPER_CHECK_INTERVAL", "1800"))
+# Seconds until a shop whose run failed is tried again, resuming from its checkpoint (see checkpoints.py)
+RETRY_DELAY = int(os.getenv("SCRAPER_RETRY_DELAY", "300"))
+# Finished runs kept for /status
+HISTORY_SIZE = 20
+
+
+def timestamp(seconds=None):
+    return datetime.fromtimestamp(seconds if seconds is not None else time.time()).isoformat(timespec="seconds")
+
+
+class ScraperWorker:
+    """
+    Runs scraper runs one at a time on a kept DB connection: scheduled checks of the shops that are due
+    and runs requested through trigger(). A shop's next check is pushed back by its interval after every
+    run that included it, or only by RETRY_DELAY when the shop failed.
+    """
+
+    def __init__(self, shops=None, intervals=None):
+        self.shops = list(shops or csv_to_sql.SHOPS)
+        self.intervals = {
+            shop: int(os.getenv(f"SCRAPER_CHECK_INTERVAL_{shop.upper()}", CHECK_INTERVAL)) for shop in self.shops
+        }
+        self.intervals.update(intervals or {})
+        # Every shop is checked as soon as the worker starts
+        self.next_check = dict.fromkeys(self.shops, 0.0)
+        self.requests = queue.Queue()
+        # Queued requests by (shops, force), an identical request is answered with the queued one
+        self.pending = {}
+        self._pending_lock = threading.Lock()
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.running = None
+        self.conn = None
+        # Basket requests come from the HTTP threads, they get their own connection and candidate index
+        self.basket_conn = None
+        self.basket_index = CandidateIndex()
+        self._basket_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = csv_to_sql.connect()
+        return self.conn
+
+    def _drop_connection(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+
+    def trigger(self, shops=None, force=False):
+        """
+        Queues a run of shops (default all), force skips the freshness check. While a run of the same
+        shops is still queued no other one is, a forced one also covering unforced requests.
+
+        :return: the queued request
+        """
+        shops = list(shops or self.shops)
+        unknown = [shop for shop in shops if shop not in self.intervals]
+        if unknown:
+            raise ValueError(f"Unknown shops: {unknown}")
+        key = frozenset(shops)
+        with self._pending_lock:
+            queued = self.pending.get((key, True)) or (None if force else self.pending.get((key, False)))
+            if queued is not None:
+                return queued
+            request = {"shops": shops, "force": bool(force), "reason": "request", "queued": timestamp()}
+            self.pending[(key, request["force"])] = request
+            self.requests.put(request)
+        return request
+
+    def run_once(self, shops, force=False, reason="schedule"):
+        record = {"reason": reason, "shops": shops, "force": force, "started": timestamp()}
+        self.running = record
+        try:
+            record["failed"] = csv_to_sql.run_scrapers_and_update_db(
+                shops=shops, force=force, conn=self._connection()
+            )
+            record["metrics"] = metrics.current.records()
+        except psycopg2.Error as e:
+            # Most likely a lost connection, the next run connects again
+            print("Scraper run failed on the database:", e)
+            record["error"] = str(e)
+            self._drop_connection()
+        except Exception as e:
+            print("Scraper run failed:", e)
+            record["error"] = str(e)
+        finally:
+            finished = time.time()
+            record["finished"] = timestamp(finished)
+            failed = record.get("failed") or (shops if "error" in record else ())
+            for shop in shops:
+                delay = min(RETRY_DELAY, self.intervals[shop]) if shop in failed else self.intervals[shop]
+                self.next_check[shop] = finished + delay
+            # The run may have changed the offers behind the cached basket candidates
+            self.basket_index.clear()
+            self.history.append(record)
+            self.running = None
+        return record
+
+    def basket(self, items, max_shops=2):
+        """Cheapest single shop and split over at most max_shops shops for a grocery list, see basket.py."""
+        with self._basket_lock:
+            if self.basket_conn is None or self.basket_conn.closed:
+                self.basket_conn = csv_to_sql.connect()
+                # Read only queries, autocommit keeps the connection from idling inside a transaction
+                self.basket_conn.autocommit = True
+            try:
+                with self.basket_conn.cursor() as cur:
+                    return optimise_basket(items, cur, max_shops, self.basket_index)
+            except psycopg2.Error:
+                self.basket_conn.close()
+                raise
+
+    def serve(self):
+        """Runs due shops and queued requests until stop() is called."""
+        while not self._stopping.is_set():
+            now = time.time()
+            due = [shop for shop in self.shops if self.next_check[shop] <= now]
+            if due:
+                self.run_once(due)
+                continue
+
+            try:
+                request = self.requests.get(timeout=min(self.next_check.values()) - now)
+            except queue.Empty:
+                continue
+            if request is None:
+                break
+            with self._pending_lock:
+                self.pending.pop((frozenset(request["shops"]), request["force"]), None)
+            self.run_once(request["shops"], request["force"], request["reason"])
+
+    def stop(self):
+        self._stopping.set()
+        self.requests.put(None)
+
+    def close(self):
+        self._drop_connection()
+        if self.basket_conn is not None and not self.basket_conn.closed:
+            self.basket_conn.close()
+        get_pool().close()
+        close_mirror()
+        close_extractor()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "queued": self.requests.qsize(),
+            "next_check": {shop: timestamp(t) for shop, t in dict(self.next_check).items()},
+            "intervals": self.intervals,
+            "history": list(self.history),
+        }
+
+
+def make_handler(worker):
+    class ControlHandler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(body, default=str).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/status":
+                return self._reply(404, {"error": "Not found"})
+            self._reply(200, worker.status())
+
+        def do_POST(self):
+            if self.path not in ("/run", "/basket"):
+                return self._reply(404, {"error": "Not found"})
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/basket":
+                    items = body.get("items")
+                    if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+                        raise ValueError("items must be a list of strings")
+                    max_shops = int(body.get("max_shops", 2))
+                else:
+                    request = worker.trigger(body.get("shops"), body.get("force", False))
+            except (ValueError, TypeError, AttributeError) as e:
+                return self._reply(400, {"error": str(e)})
+
+            if self.path == "/run":
+                return self._reply(202, request)
+            try:
+                self._reply(200, worker.basket(items, max_shops))
+            except psycopg2.Error as e:
+                self._reply(503, {"error": f"Database error: {e}"})
+
+        def log_message(self, format, *args):
+            # Keeps the backend console free of a line per status poll
+            pass
+
+    return ControlHandler
+
+
+def main():
+    worker = ScraperWorker()
+    server = ThreadingHTTPServer((HOST, PORT), make_handler(worker))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    print(f"Scraper worker listening on http://{HOST}:{PORT}")
+
+    try:
+        worker.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        worker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import re
+from functools import lru_cache
+
+# Words of a normalised title, numbers keep their decimal part ("0,5")
+WORD = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+NUMBER = re.compile(r"[0-9]+(?:[.,][0-9]+)?")
+# Quantities glued to their unit ("200g", "1,5l", "4x100") and the units themselves
+QUANTITY = re.compile(r"[0-9]+(?:[.,][0-9]+)?(?:x[0-9]+)?(?:kg|mg|g|ml|cl|l|vnt|kl|pak|cm|m)?")
+UNITS = {"kg", "mg", "g", "ml", "cl", "l", "vnt", "kl", "pak", "cm", "m", "x", "eur"}
+
+# Lithuanian noun and adjective endings (without diacritics, as in title_normalized), longest first.
+# Stripping them maps the forms of a word to one stem: morka / morkos / morku -> mork.
+# Kept in sync with the copy in Discount_Combiner_backend/routes/offers.js, which stems search queries.
+STEM_ENDINGS = ("iais", "iems", "ioms", "ams", "oms", "ems", "ims", "ums", "ais", "iai", "iu", "ies",
+                "as", "is", "ys", "us", "os", "es", "ai", "ei", "ui", "a", "e", "i", "o", "u", "y")
+MIN_STEM = 3
+
+
+def stem(word):
+    """Strips the longest Lithuanian ending that leaves at least MIN_STEM letters."""
+    for ending in STEM_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+@lru_cache(maxsize=16384)
+def search_tokens(title_normalized):
+    """
+    Extra search tokens of a normalised title: its words without quantities and units, stemmed.
+    They are stored next to the title and indexed together with it, so "morka" finds "morkos 1 kg".
+
+    :return: space separated tokens, "" if none
+    """
+    if not title_normalized:
+        return ""
+    tokens = []
+    for word in WORD.findall(title_normalized):
+        if word in UNITS or QUANTITY.fullmatch(word) or NUMBER.fullmatch(word):
+            continue
+        tokens.append(stem(word))
+    return " ".join(dict.fromkeys(tokens))
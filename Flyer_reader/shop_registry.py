@@ -0,0 +1,64 @@
+"""
+Registry of the shop readers. Every <shop>_flyer_reader.py module registers its shop with register_shop(),
+declaring how its offers are fetched, when they go stale and how a page is parsed. The runner, the scraper
+worker and the benchmarks only work from the registry, so adding a shop is adding its reader module.
+"""
+import importlib
+from pathlib import Path
+from freshness import DEFAULT_POLICY, register_policy
+
+# Fetch strategies
+# Plain requests over a pooled session
+HTTP = "http"
+# Rendered in a pooled Chrome driver, or read from the plain HTTP response first with SCRAPER_FETCH_MODE=http
+BROWSER = "browser"
+
+READER_DIR = Path(__file__).resolve().parent
+READER_PATTERN = "*_flyer_reader.py"
+
+
+class ShopReader:
+    """
+    What the runner needs to know about one shop.
+
+    :param name: shop name its offers are stored under
+    :param scrape: function(save_csv=...) -> list of Offers of the shop's current flyer
+    :param parse: function(html, cards=None) -> list of Offers of one page, cards being an optional CardCache
+    :param fetch: HTTP or BROWSER
+    :param policy: freshness policy deciding when the shop's offers are stale (see freshness.py)
+    """
+
+    def __init__(self, name, scrape, parse, fetch=HTTP, policy=DEFAULT_POLICY):
+        self.name = name
+        self.scrape = scrape
+        self.parse = parse
+        self.fetch = fetch
+        self.policy = policy
+
+    def __repr__(self):
+        return f"ShopReader({self.name!r}, fetch={self.fetch!r})"
+
+
+# Reader of every registered shop, by shop name
+READERS = {}
+
+
+def register_shop(name, scrape, parse, fetch=HTTP, policy=DEFAULT_POLICY):
+    """Registers a shop's reader, called by the reader module when it is imported."""
+    if fetch not in (HTTP, BROWSER):
+        raise ValueError(f"Unknown fetch strategy {fetch!r} for {name}")
+    reader = ShopReader(name, scrape, parse, fetch, policy)
+    READERS[name] = reader
+    register_policy(name, policy)
+    return reader
+
+
+def load_readers(directory=READER_DIR):
+    """
+    Imports every reader module in directory, which registers their shops.
+
+    :return: READERS
+    """
+    for path in sorted(directory.glob(READER_PATTERN)):
+        importlib.import_module(path.stem)
+    return READERS
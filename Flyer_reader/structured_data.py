@@ -0,0 +1,185 @@
+import json
+from datetime import date
+from html_parsing import make_soup, strainer
+from offer import Offer, price_to_cents
+from card_cache import card_cache
+from http_session import FETCH_MODE, fetch_html
+from shop_registry import HTTP, READERS
+import metrics
+
+# Only the JSON-LD script tags are built into the parse tree
+JSON_LD_ONLY = strainer("script", type="application/ld+json")
+
+
+def iter_json_ld_products(html):
+    """
+    Yields every schema.org Product found in the page's JSON-LD blocks,
+    including products nested in ItemList / @graph containers.
+    """
+    soup = make_soup(html, only=JSON_LD_ONLY)
+    for script in soup.find_all("script"):
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+        yield from _find_products(data)
+
+
+def _find_products(node):
+    if isinstance(node, list):
+        for child in node:
+            yield from _find_products(child)
+    elif isinstance(node, dict):
+        types = node.get("@type")
+        types = types if isinstance(types, list) else [types]
+        if "Product" in types:
+            yield node
+            return
+        for key in ("@graph", "itemListElement", "item"):
+            if key in node:
+                yield from _find_products(node[key])
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _cents(value):
+    """
+    Cents of a JSON-LD price: a number, or text like "2.99", "2,99 €" or "3".
+
+    :return: int, None if missing
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return round(value * 100)
+    text = str(value).replace("€", "").strip()
+    if "." in text or "," in text:
+        return price_to_cents(text)
+    return int(text) * 100
+
+
+def _old_price(offer, price):
+    """
+    Price before the discount: a strikethrough / list price specification, or an AggregateOffer's highPrice.
+
+    :return: cents, None if the offer has no higher price
+    """
+    candidates = []
+    specifications = offer.get("priceSpecification") or []
+    if isinstance(specifications, dict):
+        specifications = [specifications]
+    for spec in specifications:
+        if isinstance(spec, dict) and str(spec.get("priceType", "")).endswith(("StrikethroughPrice", "ListPrice")):
+            candidates.append(_cents(spec.get("price")))
+    if "highPrice" in offer:
+        candidates.append(_cents(offer["highPrice"]))
+    higher = [c for c in candidates if c and c > price]
+    return max(higher) if higher else None
+
+
+def json_ld_to_offer(product, shop):
+    """
+    Maps one schema.org Product into the Offer the readers produce. The old price comes from a strikethrough
+    or list price, or an AggregateOffer's highPrice, and the discount is written from the two prices
+    like the cards show it ("-34%").
+
+    :param product: Product dictionary from iter_json_ld_products
+    :param shop: shop name stored with the offer
+    :return: Offer, or None if the product has no price
+    :raises ValueError: if a price can't be read
+    """
+    offer = product.get("offers") or {}
+    if isinstance(offer, list):
+        offer = offer[0] if offer else {}
+    price = _cents(offer.get("price", offer.get("lowPrice")))
+    if price is None:
+        return None
+    old_price = _old_price(offer, price)
+
+    image = product.get("image")
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get("url")
+
+    return Offer(
+        shop,
+        product.get("name", ""),
+        price=price,
+        old_price=old_price,
+        discount=f"-{round(100 * (old_price - price) / old_price)}%" if old_price else None,
+        date_start=_date(offer["validFrom"]) if offer.get("validFrom") else None,
+        date_end=_date(offer["priceValidUntil"]) if offer.get("priceValidUntil") else None,
+        img=image or "",
+    )
+
+
+def json_ld_offers(html, shop):
+    """Returns every priced JSON-LD product in html as Offers, skipping products whose price can't be read."""
+    offers = []
+    for product in iter_json_ld_products(html):
+        try:
+            o = json_ld_to_offer(product, shop)
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Skipping {shop} JSON-LD product {product.get('name')!r}:", e)
+            continue
+        if o is not None:
+            offers.append(o)
+    return offers
+
+
+def http_page_offers(html, shop, read_cards):
+    """
+    Offers of a plain HTTP response: its server rendered cards, which give the same offers as the rendered
+    page, or its JSON-LD products when the response has no cards.
+
+    :param read_cards: the reader's html -> Offers function for the server rendered cards
+    """
+    try:
+        offers = read_cards(html)
+    except Exception as e:
+        print(f"No {shop} cards in the HTTP response:", e)
+        offers = []
+    return offers or json_ld_offers(html, shop)
+
+
+def read_shop_offers(shop, url, render_page, page_offers, mode=None):
+    """
+    Offers of a single page shop. Shops registered with the HTTP fetch strategy, and every shop in "http" mode,
+    are read from the plain HTTP response first (see http_page_offers). The page is rendered in Chrome when
+    the fetch fails or the response has no offers.
+
+    Cards unchanged since the previous run are not re-extracted (see card_cache), unless CARD_CACHE=0.
+
+    :param render_page: the reader's url -> rendered html function
+    :param page_offers: the reader's function(html, cards) -> Offers of the page
+    :param mode: "browser" or "http", defaults to SCRAPER_FETCH_MODE
+    :return: list of Offers
+    """
+    cards = card_cache(shop)
+    offers = []
+
+    if READERS[shop].fetch == HTTP or (mode or FETCH_MODE) == "http":
+        try:
+            html = fetch_html(url, shop=shop)
+            with metrics.stage(shop, "parse"):
+                offers = http_page_offers(html, shop, lambda html: page_offers(html, cards))
+        except Exception as e:
+            print(f"Could not read {shop} offers over HTTP:", e)
+        if not offers:
+            print(f"No {shop} offers in the HTTP response, rendering the page in Chrome")
+
+    if not offers:
+        html = render_page(url)
+        with metrics.stage(shop, "parse"):
+            offers = page_offers(html, cards)
+
+    metrics.add(shop, "cards", len(offers))
+    if cards:
+        cards.save()
+    return offers
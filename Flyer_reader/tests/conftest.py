@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+import pytest
+
+# The readers import each other by bare module name, like when run from Flyer_reader/
+FLYER_READER = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(FLYER_READER))
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+# Offer page and card templates of the benchmarks, see benchmarks/run_benchmarks.py
+PAGE_TEMPLATES = FLYER_READER / "benchmarks" / "fixtures"
+
+
+@pytest.fixture
+def response():
+    """
+    Synthetic HTTP response body of a shop's offers page, built from the benchmark page and card templates:
+    three server rendered cards plus JSON-LD of the same products.
+    """
+    return lambda shop: (FIXTURES / f"{shop}_response.html").read_text(encoding="utf-8")
+
+
+@pytest.fixture
+def page():
+    """A shop's offers page with cards number of cards, numbered from 0 in page order."""
+    def build(shop, cards):
+        html = (PAGE_TEMPLATES / f"{shop}_page.html").read_text(encoding="utf-8")
+        card = (PAGE_TEMPLATES / f"{shop}_card.html").read_text(encoding="utf-8")
+        return html.replace("<!-- CARDS -->", "".join(card.replace("__N__", str(n)) for n in range(cards)))
+    return build
+
+
+@pytest.fixture(autouse=True)
+def no_card_cache(monkeypatch):
+    # Every card is extracted, nothing is read from or written to the cache directory
+    import card_cache
+    monkeypatch.setattr(card_cache, "ENABLED", False)
@@ -0,0 +1,28 @@
+import random
+from itertools import combinations
+import pytest
+from basket import basket_cost, cheapest_split
+
+SHOPS = ["iki", "lidl", "maxima", "rimi", "norfa", "aibe"]
+
+
+def brute_force(prices, shops, max_shops):
+    sets = [chosen for k in range(max_shops + 1) for chosen in combinations(shops, k)]
+    return min(basket_cost(prices, chosen) for chosen in sets)
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_cheapest_split_matches_brute_force(seed):
+    rng = random.Random(seed)
+    shops = SHOPS[:rng.randint(1, len(SHOPS))]
+    # Some items are only sold in some shops, some in none
+    prices = [
+        {shop: rng.randint(50, 999) for shop in shops if rng.random() < 0.7}
+        for _ in range(rng.randint(1, 8))
+    ]
+    max_shops = rng.randint(1, len(shops))
+
+    cost, chosen = cheapest_split(prices, shops, max_shops)
+
+    assert len(chosen) <= max_shops
+    assert cost == basket_cost(prices, chosen) == brute_force(prices, shops, max_shops)
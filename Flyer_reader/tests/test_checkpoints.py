@@ -0,0 +1,26 @@
+import pytest
+import checkpoints
+from offer import Offer
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(checkpoints, "ENABLED", True)
+    monkeypatch.setattr(checkpoints, "_default_store", checkpoints.CheckpointStore(tmp_path / "checkpoints.sqlite3"))
+    return checkpoints.get_store()
+
+
+def test_completed_offers_are_resumed(store):
+    offers = [Offer("iki", "Morkos", price=99)]
+    checkpoints.save_completed("iki", offers)
+
+    assert checkpoints.completed_offers("iki") == offers
+
+
+def test_scrape_without_offers_is_not_resumed(store):
+    checkpoints.save_completed("maxima", [])
+    assert checkpoints.completed_offers("maxima") is None
+
+    # Empty checkpoints written before they were skipped
+    store.save("maxima", checkpoints.COMPLETE, [])
+    assert checkpoints.completed_offers("maxima") is None
@@ -0,0 +1,60 @@
+import re
+import pytest
+import extraction
+import iki_flyer_reader
+import lidl_flyer_reader
+import maxima_flyer_reader
+import rimi_flyer_reader
+from card_cache import extract_page, split_cards
+
+READERS = {
+    "iki": (iki_flyer_reader, "div", iki_flyer_reader.extract_iki_card),
+    "lidl": (lidl_flyer_reader, "div", lidl_flyer_reader.extract_lidl_card),
+    "maxima": (maxima_flyer_reader, "div", maxima_flyer_reader.extract_maxima_card),
+    "rimi": (rimi_flyer_reader, "li", rimi_flyer_reader.extract_item_data),
+}
+CARDS = 2 * extraction.MIN_CARDS
+
+
+def card_number(title):
+    # The page templates put the card's number first in its title
+    return int(re.search(r"\d+", title).group())
+
+
+@pytest.fixture
+def one_process(monkeypatch):
+    # EXTRACT_PROCESSES=1
+    monkeypatch.setattr(extraction, "PROCESSES", 1)
+
+
+@pytest.mark.parametrize("shop", READERS)
+def test_one_process_parses_the_page_in_order(shop, page, one_process):
+    reader, tag, extract = READERS[shop]
+    html = page(shop, CARDS)
+
+    assert extract_page(html, reader.CARD_START, tag, reader.card_from_html, extract) == []
+    offers = reader.page_offers(html)
+    assert len(offers) == CARDS
+    assert [card_number(o.title) for o in offers] == list(range(CARDS))
+    assert reader.page_offers(html) == offers
+
+
+@pytest.mark.parametrize("shop", READERS)
+def test_extracted_cards_match_the_page_parse(shop, page, one_process):
+    reader, tag, extract = READERS[shop]
+    html = page(shop, CARDS)
+
+    cards = split_cards(html, reader.CARD_START, tag)
+    assert extraction.Extractor(1).extract(cards, reader.card_from_html, extract) == reader.page_offers(html)
+
+
+def test_process_pool_matches_one_process(page, one_process):
+    reader, tag, extract = READERS["iki"]
+    html = page("iki", CARDS)
+    cards = split_cards(html, reader.CARD_START, tag)
+
+    extractor = extraction.Extractor(2)
+    try:
+        assert extractor.extract(cards, reader.card_from_html, extract) == reader.page_offers(html)
+    finally:
+        extractor.close()
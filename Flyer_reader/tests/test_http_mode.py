@@ -0,0 +1,99 @@
+import re
+import pytest
+import iki_flyer_reader
+import lidl_flyer_reader
+import maxima_flyer_reader
+import structured_data
+from structured_data import http_page_offers, json_ld_offers
+from unit_price import discount_percent
+
+READERS = {"iki": iki_flyer_reader, "lidl": lidl_flyer_reader, "maxima": maxima_flyer_reader}
+JSON_LD = re.compile(r'<script type="application/ld\+json">.*?</script>', re.S)
+
+
+def without_json_ld(html):
+    return JSON_LD.sub("", html)
+
+
+def month_day(d):
+    # The card path picks the year of "MM.DD" dates itself
+    return (d.month, d.day) if d else None
+
+
+def iter_offers(shop):
+    if shop == "lidl":
+        return list(lidl_flyer_reader.iter_lidl_offers(url="https://www.lidl.lt/c/savaites-akcijos", mode="http"))
+    return list(getattr(READERS[shop], f"iter_{shop}_offers")(mode="http"))
+
+
+@pytest.mark.parametrize("shop", READERS)
+def test_json_ld_offers_match_the_cards(shop, response):
+    html = response(shop)
+    structured = json_ld_offers(html, shop)
+    cards = READERS[shop].page_offers(without_json_ld(html))
+
+    assert len(structured) == len(cards) == 3
+    for o, card in zip(structured, cards):
+        assert o.shop == card.shop
+        # Lidl cards append the unit price footer to the product name
+        assert card.title.startswith(o.title)
+        assert (o.price, o.old_price, o.img) == (card.price, card.old_price, card.img)
+        assert month_day(o.date_start) == month_day(card.date_start)
+        assert month_day(o.date_end) == month_day(card.date_end)
+        assert discount_percent(o.discount, o.price, o.old_price) == discount_percent(None, card.price, card.old_price)
+
+
+@pytest.mark.parametrize("shop", READERS)
+def test_cards_are_read_before_json_ld(shop, response):
+    # The cards keep what the JSON-LD lacks: title footers, store limiters and the shops' discount labels
+    html = response(shop)
+
+    assert http_page_offers(html, shop, READERS[shop].page_offers) == READERS[shop].page_offers(html)
+
+
+@pytest.mark.parametrize("shop", READERS)
+def test_json_ld_is_read_when_the_response_has_no_cards(shop, response):
+    scripts = "".join(JSON_LD.findall(response(shop)))
+    html = f"<html><head>{scripts}</head><body></body></html>"
+
+    offers = http_page_offers(html, shop, READERS[shop].page_offers)
+
+    assert offers == json_ld_offers(html, shop)
+    assert len(offers) == 3
+
+
+def test_unreadable_json_ld_price_only_skips_that_product(response):
+    html = response("maxima").replace('"price": 2.29', '"price": "n/a"', 1)
+
+    assert [o.title for o in json_ld_offers(html, "maxima")] == ["Slyviniai pomidorai 2, 1 kg", "Slyviniai pomidorai 3, 1 kg"]
+
+
+@pytest.mark.parametrize("shop", READERS)
+def test_http_mode_reads_the_response_without_chrome(shop, response, monkeypatch):
+    reader = READERS[shop]
+    monkeypatch.setattr(structured_data, "fetch_html", lambda url, shop=None: response(shop))
+    monkeypatch.setattr(reader, "render_page", lambda *args: pytest.fail("Chrome was started"))
+
+    offers = iter_offers(shop)
+
+    assert offers == reader.page_offers(response(shop))
+
+
+@pytest.mark.parametrize("shop", READERS)
+@pytest.mark.parametrize("failure", ["status", "parse"])
+def test_http_mode_falls_back_to_chrome(shop, failure, response, monkeypatch):
+    reader = READERS[shop]
+
+    def fetch(url, shop=None):
+        if failure == "status":
+            raise Exception(f"Failed to fetch {url}, status code: 503")
+        return "<html><body>Access denied</body></html>"
+
+    rendered = []
+    monkeypatch.setattr(structured_data, "fetch_html", fetch)
+    monkeypatch.setattr(reader, "render_page", lambda *args: rendered.append(True) or without_json_ld(response(shop)))
+
+    offers = iter_offers(shop)
+
+    assert rendered == [True]
+    assert offers == reader.page_offers(without_json_ld(response(shop)))
@@ -0,0 +1,16 @@
+import pytest
+from unit_price import unit_fields
+
+
+@pytest.mark.parametrize("title, price, expected", [
+    ("pienas 2,5 % 1 l", 129, (1.0, "l", 129)),
+    ("sultys 6 x 0,2 l", 199, (1.2, "l", 166)),
+    ("apelsinai navel rimi, kg", 149, (1, "kg", 149)),
+    ("sviestas, 82 % 200 g | 1 kg = 5,95 €", 119, (0.2, "kg", 595)),
+    # Sub-cent prices per piece would sort as free
+    ("vatos pagaliukai almeda, 200 vnt.", 99, (200.0, "vnt", None)),
+    # "l." counts sheets, not litres
+    ("pop. ranksl. rimi , 2 sl. 600 l.", 239, (None, None, None)),
+])
+def test_unit_price(title, price, expected):
+    assert unit_fields(title, price, None, None)[:3] == expected
@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+
+# Units a quantity is converted to, with the factor from each unit written in titles
+BASE_UNITS = {
+    "kg": ("kg", 1), "g": ("kg", 0.001), "mg": ("kg", 0.000001),
+    "l": ("l", 1), "ml": ("l", 0.001), "cl": ("l", 0.01),
+    "vnt": ("vnt", 1),
+}
+_UNIT = r"(kg|mg|g|ml|cl|l|vnt)"
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+
+# Quantities in a normalised title: "200 g", "0,2 l", "355ml", "60vnt",
+# multipacks "6 x 40 g" / "4×100g" / "2 vnt. × 81 g". "l." is a count of sheets ("2 sl. 600 l."), not litres
+_QUANTITY_UNIT = r"(kg|mg|g|ml|cl|l(?!\.)|vnt)"
+QUANTITY = re.compile(rf"(?<![\w.,])(?:(\d+)\s*(?:vnt\.?\s*)?[x×]\s*)?{_NUMBER}\s*{_QUANTITY_UNIT}(?![\w])")
+# Titles of goods sold by weight or piece end in a bare unit: "apelsinai navel rimi, kg", one after a
+# number is a count ("600 l.")
+BARE_UNIT = re.compile(rf"(?:^|(?<!\d)[\s,]){_UNIT}\.?$")
+# Lidl's price footer appended to the title: "sviestas, 82 % 200 g | 1 kg = 5,95 €"
+REFERENCE_PRICE = re.compile(rf"\|\s*(?:{_NUMBER}\s*)?{_UNIT}\.?\s*=\s*(\d+[.,]\d+)\s*(?:€|eur)")
+
+# Discounts as written by the shops: "-30%", "-40 %", "su Lidl Plus-44%", "1+1", "4+2", "Su pigintuvu 1.99"
+PERCENT = re.compile(r"-?\s*(\d+(?:[.,]\d+)?)\s*%")
+MULTI_BUY = re.compile(r"(?<!\d)(\d+)\s*\+\s*(\d+)(?!\d)")
+CARD_PRICE = re.compile(r"pigintuvu\s+(\d+[.,]\d+)", re.I)
+
+
+def _number(text):
+    return float(text.replace(",", "."))
+
+
+def _cents(text):
+    return round(_number(text) * 100)
+
+
+@lru_cache(maxsize=16384)
+def parse_quantity(title_normalized, price_unit=None):
+    """
+    Quantity of an offer from its normalised title.
+
+    :param price_unit: unit the shop's price is given per ("kg" for Rimi's "€/kg" prices), if any.
+                       Per piece prices ("vnt") are the package price, so the title's quantity is used.
+    :return: (quantity, unit, reference_cents): quantity in kg, l or vnt (None if not found), the base unit,
+             and the price per base unit the title states itself (Lidl), else None
+    """
+    if price_unit in ("kg", "l"):
+        return 1, price_unit, None
+
+    title, _, footer = (title_normalized or "").partition("|")
+    reference = None
+    match = REFERENCE_PRICE.search("|" + footer) if footer else None
+    if match:
+        amount, unit, price = match.groups()
+        base, factor = BASE_UNITS[unit]
+        reference = round(_cents(price) / ((_number(amount) if amount else 1) * factor))
+
+    # Sizes come last in titles ("sausk. huggies 4, 8-16kg, 60vnt"), so the last quantity counts
+    matches = QUANTITY.findall(title)
+    if matches:
+        count, amount, unit = matches[-1]
+        base, factor = BASE_UNITS[unit]
+        quantity = _number(amount) * factor * (int(count) if count else 1)
+        if quantity > 0:
+            return round(quantity, 6), base, reference
+
+    match = BARE_UNIT.search(title.strip())
+    if match:
+        return 1, BASE_UNITS[match.group(1)][0], reference
+    return None, None, reference
+
+
+@lru_cache(maxsize=16384)
+def discount_percent(discount, price=None, old_price=None):
+    """
+    Discount in whole percent: as written ("-30%"), from multi-buy offers ("2+1" -> 33), from a loyalty card
+    price ("Su pigintuvu 1.99") or from the old and new prices.
+
+    :param price, old_price: prices in cents, or None
+    :return: int, None if unknown
+    """
+    discount = discount or ""
+    match = PERCENT.search(discount)
+    if match:
+        return round(_number(match.group(1)))
+    match = MULTI_BUY.search(discount)
+    if match:
+        paid, free = map(int, match.groups())
+        if paid and free:
+            return round(100 * free / (paid + free))
+    match = CARD_PRICE.search(discount)
+    regular = old_price or price
+    if match and regular:
+        return round(100 * (regular - _cents(match.group(1))) / regular)
+    if price and old_price and old_price > price:
+        return round(100 * (old_price - price) / old_price)
+    return None
+
+
+def unit_fields(title_normalized, price, old_price, discount, price_unit=None):
+    """
+    Typed unit columns of one offer, the last four of OFFER_COLUMNS in csv_to_sql.
+
+    :param price, old_price: prices in cents, or None
+    :return: (quantity, unit, unit_price, discount_percent), unit_price in whole cents per kg, l or vnt,
+             None when it is below a cent (e.g. cotton buds by the 200), which would sort as free
+    """
+    quantity, unit, unit_price = parse_quantity(title_normalized, price_unit)
+    if unit_price is None and quantity and price and price >= quantity:
+        unit_price = round(price / quantity)
+    if unit_price == 0:
+        unit_price = None
+    return quantity, unit, unit_price, discount_percent(discount, price, old_price)
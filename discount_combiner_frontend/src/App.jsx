@@ -111,15 +111,10 @@ function App() {
       return;
     }
 
-    const groups = [];
-    for (const item of groceryList) {
-      const res = await fetch(
-        `http://localhost:3000/api/search?q=${encodeURIComponent(item)}&limit=40`
-      );
-      const data = await res.json();
-
-      groups.push({ item, results: data });
-    }
+    // Each item's best match with the same product in the other shops, then its other top matches, in one request
+    const params = groceryList.map(item => `item=${encodeURIComponent(item)}`).join("&");
+    const res = await fetch(`http://localhost:3000/api/search/groups?${params}&limit=${LIMIT}`);
+    const groups = await res.json();
 
     setGroupedResults(groups);
   }
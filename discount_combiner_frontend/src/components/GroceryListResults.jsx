@@ -1,3 +1,5 @@
+import offerImage from "../offerImage";
+
 export default function GroceryListResults({ groupedResults }) {
   return (
     <div className="w-full mt-6">
@@ -12,7 +14,7 @@ export default function GroceryListResults({ groupedResults }) {
             {group.results.map((offer, i) => (
               <div key={i} className="border rounded p-3 shadow">
                 <img
-                  src={`http://localhost:3000/${offer.img}`}
+                  src={offerImage(offer.img)}
                   alt={offer.title}
                   className="w-full h-32 object-cover mb-2"
                 />
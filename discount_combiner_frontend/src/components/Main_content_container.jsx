@@ -1,6 +1,7 @@
 // src/components/Main_content_container.jsx
 import React from "react";
 import "../Index.css";
+import offerImage from "../offerImage";
 
 /**
  * Props:
@@ -35,7 +36,7 @@ export default function Main_content_container({
       >
         <div className="relative">
           <img
-            src={offer.img}
+            src={offerImage(offer.img)}
             loading="lazy"
             alt={offer.title}
             className="w-full h-40 object-contain rounded-lg mb-3"
@@ -0,0 +1,6 @@
+// Offer images are mirrored by the scraper to the backend's /images route ("images/offers/<hash>.webp"),
+// offers whose image could not be mirrored keep the shop's own URL
+export default function offerImage(img) {
+  if (!img || /^https?:\/\//.test(img)) return img;
+  return `http://localhost:3000/${img}`;
+}